@@ -2,18 +2,48 @@
 # -*- coding: utf-8 -*-
 
 import requests
-import json
 import time
+import statistics
+import threading
+import struct
+import zlib
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # API基础URL
 BASE_URL = "http://localhost:8000"
 
+# 每个线程复用自己的会话和keep-alive连接（requests.Session 不保证线程安全，不在线程间共享）
+_thread_local = threading.local()
+# 所有线程创建的会话，测试结束时统一关闭
+_sessions = []
+_sessions_lock = threading.Lock()
+
+def get_session():
+    """返回当前线程的会话，首次调用时创建"""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        session.headers.update({"Connection": "keep-alive"})
+        _thread_local.session = session
+        with _sessions_lock:
+            _sessions.append(session)
+    return session
+
+def close_sessions():
+    """关闭所有线程的会话及其连接"""
+    with _sessions_lock:
+        for session in _sessions:
+            session.close()
+        _sessions.clear()
+
 def test_health():
     """测试健康检查"""
     print("1. 测试健康检查...")
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = get_session().get(f"{BASE_URL}/health")
         if response.status_code == 200:
             data = response.json()
             print(f"✓ 服务状态: {data['status']}")
@@ -30,7 +60,7 @@ def test_stats():
     """测试系统统计"""
     print("\n2. 获取系统统计...")
     try:
-        response = requests.get(f"{BASE_URL}/stats")
+        response = get_session().get(f"{BASE_URL}/stats")
         if response.status_code == 200:
             data = response.json()
             stats = data['stats']
@@ -58,7 +88,7 @@ def test_search():
     for i, search_data in enumerate(test_queries, 1):
         print(f"\n  测试 {i}: 搜索 '{search_data['query']}'")
         try:
-            response = requests.post(f"{BASE_URL}/search", json=search_data)
+            response = get_session().post(f"{BASE_URL}/search", json=search_data)
             if response.status_code == 200:
                 data = response.json()
                 print(f"  ✓ 找到 {data['total_results']} 张图片")
@@ -85,7 +115,7 @@ def test_add_description():
     }
     
     try:
-        response = requests.post(f"{BASE_URL}/image/description", json=test_data)
+        response = get_session().post(f"{BASE_URL}/image/description", json=test_data)
         if response.status_code == 200:
             data = response.json()
             if data['success']:
@@ -104,7 +134,7 @@ def test_get_description():
     
     image_name = "test_image.jpg"
     try:
-        response = requests.get(f"{BASE_URL}/image/{image_name}/description")
+        response = get_session().get(f"{BASE_URL}/image/{image_name}/description")
         if response.status_code == 200:
             data = response.json()
             if data['success']:
@@ -127,7 +157,7 @@ def test_similarity_method():
     for method in methods:
         print(f"  切换到: {method}")
         try:
-            response = requests.put(f"{BASE_URL}/similarity-method", json={"method": method})
+            response = get_session().put(f"{BASE_URL}/similarity-method", json={"method": method})
             if response.status_code == 200:
                 data = response.json()
                 print(f"  ✓ {data['message']}")
@@ -135,21 +165,29 @@ def test_similarity_method():
                 print(f"  ✗ 切换失败: {response.status_code}")
         except Exception as e:
             print(f"  ✗ 请求失败: {e}")
-        
-        time.sleep(1)  # 等待一秒
+
+def make_test_png():
+    """生成一张1x1白色像素的最小PNG图片"""
+    def chunk(chunk_type, data):
+        return (struct.pack(">I", len(data)) + chunk_type + data
+                + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+    
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)  # 宽高1，8位RGB
+    pixels = zlib.compress(b"\x00\xff\xff\xff")           # 过滤类型0 + 一个白色像素
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", pixels) + chunk(b"IEND", b"")
 
 def upload_test_image():
     """上传测试图片"""
     print("\n7. 测试图片上传...")
     
-    # 创建一个简单的测试文件
-    test_file_path = Path("test_image.txt")
-    test_file_path.write_text("这是一个测试文件，模拟图片上传")
+    # 创建一张真实的测试图片，服务端会检查文件头
+    test_file_path = Path("test_image.png")
+    test_file_path.write_bytes(make_test_png())
     
     try:
         with open(test_file_path, 'rb') as f:
-            files = {'file': ('test_image.jpg', f, 'image/jpeg')}
-            response = requests.post(f"{BASE_URL}/upload", files=files)
+            files = {'file': ('test_image.png', f, 'image/png')}
+            response = get_session().post(f"{BASE_URL}/upload", files=files)
             
         if response.status_code == 200:
             data = response.json()
@@ -164,8 +202,7 @@ def upload_test_image():
         print(f"✗ 上传失败: {e}")
     finally:
         # 清理测试文件
-        if test_file_path.exists():
-            test_file_path.unlink()
+        test_file_path.unlink(missing_ok=True)
 
 def test_vector_store():
     """测试向量库功能"""
@@ -174,7 +211,7 @@ def test_vector_store():
     # 获取向量库信息
     print("  8.1 获取向量库信息")
     try:
-        response = requests.get(f"{BASE_URL}/vector-store/info")
+        response = get_session().get(f"{BASE_URL}/vector-store/info")
         if response.status_code == 200:
             data = response.json()
             if data['success']:
@@ -196,7 +233,7 @@ def test_vector_store():
     # 获取向量库统计
     print("\n  8.2 获取向量库统计")
     try:
-        response = requests.get(f"{BASE_URL}/vector-store/stats")
+        response = get_session().get(f"{BASE_URL}/vector-store/stats")
         if response.status_code == 200:
             data = response.json()
             if data['success']:
@@ -214,7 +251,7 @@ def test_vector_store():
     # 重建向量索引
     print("\n  8.3 重建向量索引")
     try:
-        response = requests.post(f"{BASE_URL}/vector-store/rebuild")
+        response = get_session().post(f"{BASE_URL}/vector-store/rebuild")
         if response.status_code == 200:
             data = response.json()
             if data['success']:
@@ -226,51 +263,90 @@ def test_vector_store():
     except Exception as e:
         print(f"  ✗ 请求失败: {e}")
 
+def timed_search(query):
+    """执行一次搜索并返回 (查询, 耗时, 结果数, 错误信息)"""
+    start_ns = time.perf_counter_ns()
+    try:
+        response = get_session().post(f"{BASE_URL}/search", json={
+            "query": query,
+            "top_k": 3,
+            "threshold": 0.1
+        })
+        elapsed = (time.perf_counter_ns() - start_ns) / 1e9
+        if response.status_code == 200:
+            return query, elapsed, response.json()['total_results'], None
+        return query, elapsed, 0, "搜索失败"
+    except Exception as e:
+        return query, (time.perf_counter_ns() - start_ns) / 1e9, 0, f"请求失败 - {e}"
+
 def test_performance_comparison():
     """测试性能对比"""
     print("\n9. 性能对比测试...")
     
     test_queries = ["美丽风景", "可爱动物", "现代建筑", "自然景观", "城市夜景"]
     
-    for method in ["tfidf", "sentence_transformer"]:
-        print(f"\n  测试方法: {method}")
-        
-        # 切换方法
-        try:
-            response = requests.put(f"{BASE_URL}/similarity-method", json={"method": method})
-            if response.status_code == 200:
-                print(f"  ✓ 已切换到 {method}")
-            else:
-                print(f"  ✗ 切换方法失败")
-                continue
-        except Exception as e:
-            print(f"  ✗ 切换方法失败: {e}")
-            continue
-        
-        # 测试搜索性能
-        total_time = 0
-        for query in test_queries:
-            start_time = time.time()
+    # 各方法共用同一个线程池，工作线程的会话和keep-alive连接在多轮测试之间复用
+    with ThreadPoolExecutor(max_workers=len(test_queries)) as executor:
+        for method in ["tfidf", "sentence_transformer"]:
+            print(f"\n  测试方法: {method}")
+            
+            # 切换方法
             try:
-                response = requests.post(f"{BASE_URL}/search", json={
-                    "query": query,
-                    "top_k": 3,
-                    "threshold": 0.1
-                })
-                end_time = time.time()
-                
+                response = get_session().put(f"{BASE_URL}/similarity-method", json={"method": method})
                 if response.status_code == 200:
-                    data = response.json()
-                    search_time = end_time - start_time
-                    total_time += search_time
-                    print(f"    '{query}': {search_time:.3f}s, 找到 {data['total_results']} 个结果")
+                    print(f"  ✓ 已切换到 {method}")
                 else:
-                    print(f"    '{query}': 搜索失败")
+                    print(f"  ✗ 切换方法失败")
+                    continue
             except Exception as e:
-                print(f"    '{query}': 请求失败 - {e}")
+                print(f"  ✗ 切换方法失败: {e}")
+                continue
+            
+            # 并发发起所有查询，分别统计单次延迟和整体耗时
+            wall_start_ns = time.perf_counter_ns()
+            timings = list(executor.map(timed_search, test_queries))
+            wall_time = (time.perf_counter_ns() - wall_start_ns) / 1e9
+            
+            elapsed_times = []
+            for query, elapsed, total_results, error in timings:
+                if error:
+                    print(f"    '{query}': {error}")
+                else:
+                    elapsed_times.append(elapsed)
+                    print(f"    '{query}': {elapsed:.3f}s, 找到 {total_results} 个结果")
+            
+            if elapsed_times:
+                # 用分位数代替平均值，避免首个冷启动请求拉高结果
+                p50 = statistics.median(elapsed_times)
+                p95 = statistics.quantiles(elapsed_times, n=20, method="inclusive")[-1] if len(elapsed_times) > 1 else elapsed_times[0]
+                print(f"  单次延迟: p50={p50:.3f}s p95={p95:.3f}s min={min(elapsed_times):.3f}s")
+            print(f"  总耗时(并发): {wall_time:.3f}s")
+
+def test_batch_search():
+    """测试批量搜索"""
+    print("\n10. 测试批量搜索...")
+    
+    test_queries = ["美丽风景", "可爱动物", "现代建筑", "自然景观", "城市夜景"]
+    
+    try:
+        start_ns = time.perf_counter_ns()
+        response = get_session().post(f"{BASE_URL}/search/batch", json={
+            "queries": test_queries,
+            "top_k": 3,
+            "threshold": 0.1
+        })
+        elapsed = (time.perf_counter_ns() - start_ns) / 1e9
         
-        avg_time = total_time / len(test_queries) if test_queries else 0
-        print(f"  平均搜索时间: {avg_time:.3f}s")
+        if response.status_code == 200:
+            data = response.json()
+            for query, results in data['results_by_query'].items():
+                print(f"  ✓ '{query}': 找到 {len(results)} 个结果")
+            print(f"  总耗时: {elapsed:.3f}s, 平均每个查询: {elapsed / len(test_queries):.3f}s")
+        else:
+            print(f"  ✗ 批量搜索失败: {response.status_code}")
+            print(f"  错误: {response.text}")
+    except Exception as e:
+        print(f"  ✗ 请求失败: {e}")
 
 def main():
     """主测试函数"""
@@ -286,6 +362,7 @@ def main():
     # 执行测试
     if not test_health():
         print("\n服务未启动或无法访问，测试终止")
+        close_sessions()
         return
     
     test_stats()
@@ -296,12 +373,15 @@ def main():
     upload_test_image()
     test_vector_store()
     test_performance_comparison()
+    test_batch_search()
+    close_sessions()
     
     print("\n" + "=" * 60)
     print("测试完成！")
     print("你可以访问以下地址查看API文档:")
     print(f"- Swagger UI: {BASE_URL}/docs")
     print(f"- ReDoc: {BASE_URL}/redoc")
+    print(f"- 批量搜索: {BASE_URL}/search/batch")
     print("\n向量库相关接口:")
     print(f"- 向量库信息: {BASE_URL}/vector-store/info")
     print(f"- 向量库统计: {BASE_URL}/vector-store/stats")
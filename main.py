@@ -2,16 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
+import asyncio
+import orjson
 import uvicorn
+try:
+    # 与 src 中的分词模块使用同一个jieba实现，预热的才是实际使用的词典
+    import jieba_fast as jieba
+    import jieba_fast.posseg as pseg
+except ImportError:
+    import jieba
+    import jieba.posseg as pseg
+from collections import OrderedDict
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, File, UploadFile
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from src.matcher import ImageMatcher
 from src.models import (
-    SearchRequest, SearchResponse, ImageResult,
+    SearchRequest, SearchResponse,
+    BatchSearchRequest, BatchSearchResponse,
     AddDescriptionRequest, ImageDescriptionResponse,
     SystemStatsResponse, UpdateMethodRequest,
     BaseResponse, HealthResponse, KeywordExtractionRequest,
@@ -22,16 +34,164 @@ from src.models import (
 # 全局变量存储匹配器实例
 matcher = None
 
+# 上传文件时每次读取的块大小（1 MiB）
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# 上传文件大小上限（默认20 MiB）
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 20 << 20))
+
+# 常见图片格式的文件头魔数，不信任客户端提供的 Content-Type
+_IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',          # JPEG
+    b'\x89PNG\r\n\x1a\n',     # PNG
+    b'GIF87a', b'GIF89a',     # GIF
+    b'BM',                    # BMP
+)
+
+
+def _is_image_header(header: bytes) -> bool:
+    """根据文件头判断是否为支持的图片格式"""
+    if header.startswith(_IMAGE_SIGNATURES):
+        return True
+    # WEBP: RIFF....WEBP
+    return header[:4] == b'RIFF' and header[8:12] == b'WEBP'
+
+# 图片目录中已存在的文件名缓存，避免每个搜索结果都调用一次 os.path.exists
+IMAGE_SET_TTL = 5.0
+_image_set_cache = {"t": 0.0, "set": frozenset()}
+
+
+def _images_present() -> frozenset:
+    """返回图片目录中的文件名集合，超过TTL后重新扫描"""
+    now = time.monotonic()
+    if now - _image_set_cache["t"] > IMAGE_SET_TTL:
+        try:
+            images = frozenset(os.listdir(os.path.join("data", "images")))
+        except FileNotFoundError:
+            images = frozenset()
+        if images != _image_set_cache["set"]:
+            # 缓存的搜索结果中 file_exists 可能已过期
+            _invalidate_search_cache()
+        _image_set_cache["set"] = images
+        _image_set_cache["t"] = now
+    return _image_set_cache["set"]
+
+
+def _invalidate_image_set():
+    """图片目录发生变化后让缓存立即失效"""
+    _image_set_cache["t"] = 0.0
+
+
+# /search 的结果缓存：(规范化查询, top_k, threshold, method) -> (结果数, 序列化后的results数组)
+# 这是唯一的搜索结果缓存；缓存版本由本模块的失效计数和匹配器的 data_version 共同决定
+SEARCH_CACHE_SIZE = 512
+_search_result_cache = OrderedDict()
+# 每次失效时递增（图片文件变化等匹配器感知不到的变化）
+_search_cache_epoch = 0
+# 当前缓存内容对应的版本
+_search_cache_state = {"version": None}
+
+
+def _search_cache_version():
+    """当前的缓存版本，任一部分变化都说明缓存的结果可能已过期"""
+    return _search_cache_epoch, matcher.data_version
+
+
+def _invalidate_search_cache():
+    """描述、映射、图片文件或相似度方法变化后清空搜索结果缓存"""
+    global _search_cache_epoch
+    _search_cache_epoch += 1
+    _search_result_cache.clear()
+
+
+def _search_response_body(query: str, total_results: int, results_json: bytes) -> bytes:
+    """拼接 /search 的响应体：results部分可以复用缓存中已序列化的字节，只有原始查询需要重新序列化"""
+    message = orjson.dumps(f"找到 {total_results} 张匹配的图片")
+    return (b'{"success":true,"message":' + message +
+            b',"query":' + orjson.dumps(query) +
+            b',"total_results":' + str(total_results).encode() +
+            b',"results":' + results_json + b'}')
+
+
+# /search 请求微批处理：最多等待5ms，凑够32个请求合并为一次矩阵乘法
+SEARCH_MAX_BATCH_SIZE = 32
+SEARCH_MAX_WAIT_TIME = 0.005
+# 单个/search请求等待批处理结果的上限（秒）
+SEARCH_RESULT_TIMEOUT = 30.0
+_search_queue = None
+_search_worker = None
+
+
+async def _search_batch_worker():
+    """后台任务：收集并发的搜索请求，按 (top_k, threshold) 分组后批量计算
+    
+    第一个请求到达后等待一个时间窗口，再用 get_nowait 取走窗口内到达的请求，
+    不会像 wait_for(get()) 超时那样丢失已出队的请求；单个批次出错只影响该批次
+    """
+    while True:
+        batch = [await _search_queue.get()]
+        try:
+            if _search_queue.qsize() < SEARCH_MAX_BATCH_SIZE - 1:
+                await asyncio.sleep(SEARCH_MAX_WAIT_TIME)
+            while len(batch) < SEARCH_MAX_BATCH_SIZE:
+                try:
+                    batch.append(_search_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            
+            groups = {}
+            for request, future in batch:
+                groups.setdefault((request.top_k, request.threshold), []).append((request, future))
+            
+            for (top_k, threshold), items in groups.items():
+                try:
+                    results_by_query = matcher.search_images_batch(
+                        [request.query for request, _ in items], top_k, threshold
+                    )
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for request, future in items:
+                    # 客户端断开时future可能已被取消
+                    if not future.done():
+                        future.set_result(results_by_query[request.query])
+        except Exception as e:
+            print(f"搜索批处理出错: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+def _on_search_worker_done(task: asyncio.Task):
+    """批处理任务意外退出时记录原因（关闭时的取消除外）"""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"搜索批处理任务异常退出: {task.exception()!r}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    global matcher
+    global matcher, _search_queue, _search_worker
     print("正在启动图片描述匹配系统...")
     
     try:
-        # 初始化匹配器
-        matcher = ImageMatcher()
+        # 预加载jieba词典，避免首个请求承担词典解析的开销
+        jieba.initialize()
+        list(pseg.cut("初始化"))
+        
+        # 初始化匹配器（VECTOR_INDEX_TYPE=hnsw/ivf 启用近似最近邻索引，QUANTIZE_INT8=true 启用int8描述向量）
+        matcher = ImageMatcher(
+            vector_index_type=os.getenv("VECTOR_INDEX_TYPE", "flat"),
+            quantize_int8=os.getenv("QUANTIZE_INT8", "false").lower() == "true"
+        )
+        
+        # 启动搜索微批处理任务
+        _search_queue = asyncio.Queue()
+        _search_worker = asyncio.create_task(_search_batch_worker())
+        _search_worker.add_done_callback(_on_search_worker_done)
         print("系统初始化完成")
         yield
     except Exception as e:
@@ -39,6 +199,8 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         print("系统正在关闭...")
+        if _search_worker is not None:
+            _search_worker.cancel()
 
 
 # 创建FastAPI应用
@@ -79,6 +241,22 @@ async def health_check():
     )
 
 
+def to_result_dicts(results):
+    """将匹配器返回的结果转换为可直接序列化的字典，字段与 ImageResult 一致"""
+    present = _images_present()
+    return [
+        {
+            "image_name": result["image_name"],
+            "image_path": result["image_path"],
+            "description": result["description"],
+            "keywords": result["keywords"],
+            "similarity_score": float(result["similarity_score"]),
+            "file_exists": os.path.basename(result["image_path"]) in present
+        }
+        for result in results
+    ]
+
+
 @app.post("/search", response_model=SearchResponse)
 async def search_images(request: SearchRequest):
     """搜索图片接口"""
@@ -86,35 +264,74 @@ async def search_images(request: SearchRequest):
         if not matcher:
             raise HTTPException(status_code=500, detail="系统未初始化")
         
-        # 执行搜索
-        results = matcher.search_images(
-            query=request.query,
+        # 规范化后相同的请求直接复用缓存的结果（先刷新图片集合，文件变化时缓存会被清空）
+        _images_present()
+        cache_version = _search_cache_version()
+        if _search_cache_state["version"] != cache_version:
+            _search_result_cache.clear()
+            _search_cache_state["version"] = cache_version
+        cache_key = (matcher.normalize_query(request.query), request.top_k, request.threshold,
+                     matcher.similarity_calculator.method)
+        cached = _search_result_cache.get(cache_key)
+        if cached is not None:
+            _search_result_cache.move_to_end(cache_key)
+            return Response(content=_search_response_body(request.query, *cached), media_type="application/json")
+        
+        # 加入微批处理队列，与同一时间窗口内的其他请求一起计算
+        if _search_worker is None or _search_worker.done():
+            raise HTTPException(status_code=503, detail="搜索批处理任务未运行")
+        future = asyncio.get_running_loop().create_future()
+        await _search_queue.put((request, future))
+        try:
+            results = await asyncio.wait_for(future, SEARCH_RESULT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="搜索超时")
+        
+        # 结果来自内部可信数据，直接序列化，跳过 SearchResponse 的Pydantic校验
+        image_results = to_result_dicts(results)
+        results_json = orjson.dumps(image_results)
+        
+        # 计算期间缓存被失效的结果不写入缓存
+        if cache_version == _search_cache_version():
+            _search_result_cache[cache_key] = (len(image_results), results_json)
+            if len(_search_result_cache) > SEARCH_CACHE_SIZE:
+                _search_result_cache.popitem(last=False)
+        return Response(content=_search_response_body(request.query, len(image_results), results_json),
+                        media_type="application/json")
+        
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
+
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_images_batch(request: BatchSearchRequest):
+    """批量搜索图片接口"""
+    try:
+        if not matcher:
+            raise HTTPException(status_code=500, detail="系统未初始化")
+        
+        # 一次请求处理所有查询
+        results_by_query = matcher.search_images_batch(
+            queries=request.queries,
             top_k=request.top_k,
             threshold=request.threshold
         )
         
-        # 转换结果格式
-        image_results = []
-        for result in results:
-            image_results.append(ImageResult(
-                image_name=result["image_name"],
-                image_path=result["image_path"],
-                description=result["description"],
-                keywords=result["keywords"],
-                similarity_score=result["similarity_score"],
-                file_exists=os.path.exists(result["image_path"])
-            ))
-        
-        return SearchResponse(
-            success=True,
-            message=f"找到 {len(image_results)} 张匹配的图片",
-            query=request.query,
-            total_results=len(image_results),
-            results=image_results
-        )
+        # 与 /search 相同，跳过 BatchSearchResponse/ImageResult 的Pydantic校验，直接用orjson序列化
+        return Response(content=orjson.dumps({
+            "success": True,
+            "message": f"完成 {len(results_by_query)} 个查询的搜索",
+            "total_queries": len(results_by_query),
+            "results_by_query": {
+                query: to_result_dicts(results)
+                for query, results in results_by_query.items()
+            }
+        }), media_type="application/json")
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批量搜索失败: {str(e)}")
 
 
 @app.get("/image/{image_name}/description", response_model=ImageDescriptionResponse)
@@ -156,10 +373,14 @@ async def add_image_description(request: AddDescriptionRequest):
         success = matcher.add_image_description(
             image_name=request.image_name,
             description=request.description,
-            keywords=request.keywords
+            keywords=request.keywords,
+            save=False
         )
         
         if success:
+            _invalidate_image_set()
+            _invalidate_search_cache()
+            await matcher.data_processor.save_mappings_async()
             return BaseResponse(
                 success=True,
                 message="描述添加成功"
@@ -201,6 +422,7 @@ async def update_similarity_method(request: UpdateMethodRequest):
             raise HTTPException(status_code=500, detail="系统未初始化")
         
         matcher.update_similarity_method(request.method)
+        _invalidate_search_cache()
         
         return BaseResponse(
             success=True,
@@ -236,23 +458,42 @@ async def get_image_file(image_name: str):
 async def upload_image(file: UploadFile = File(...)):
     """上传图片接口"""
     try:
-        # 检查文件类型
-        if not file.content_type.startswith("image/"):
+        # 只保留文件名部分，空文件名或 "."、".." 无法作为图片文件名
+        file_name = os.path.basename(file.filename or "")
+        if file_name in ("", ".", ".."):
+            raise HTTPException(status_code=400, detail="无效的文件名")
+        
+        # 只读取文件头检查文件类型
+        header = await file.read(32)
+        if not _is_image_header(header):
             raise HTTPException(status_code=400, detail="只支持图片文件")
         
         # 确保上传目录存在
         upload_dir = os.path.join("data", "images")
         os.makedirs(upload_dir, exist_ok=True)
         
-        # 保存文件
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # 分块写入临时文件，内存占用与文件大小无关；完整写入后再替换目标文件
+        file_path = os.path.join(upload_dir, file_name)
+        temp_path = file_path + ".part"
+        try:
+            size = len(header)
+            with open(temp_path, "wb") as buffer:
+                buffer.write(header)
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_SIZE:
+                        raise HTTPException(status_code=413, detail="文件过大")
+                    buffer.write(chunk)
+            os.replace(temp_path, file_path)
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(temp_path)
+        _invalidate_image_set()
+        _invalidate_search_cache()
         
         return BaseResponse(
             success=True,
-            message=f"图片 {file.filename} 上传成功"
+            message=f"图片 {file_name} 上传成功"
         )
         
     except Exception as e:
@@ -291,23 +532,26 @@ async def process_batch_descriptions(request: BatchDescriptionRequest):
         if not matcher:
             raise HTTPException(status_code=500, detail="系统未初始化")
         
+        # 一次性批量提取所有描述的关键词
+        if request.auto_generate_keywords:
+            keywords_list = matcher.data_processor.extract_keywords_batch(request.descriptions)
+        else:
+            keywords_list = [[] for _ in request.descriptions]
+        
         # 将字符串列表转换为描述对象列表
         desc_objects = []
-        for i, text in enumerate(request.descriptions):
+        for i, (text, keywords) in enumerate(zip(request.descriptions, keywords_list)):
             desc_obj = {
                 "id": f"batch_desc_{len(matcher.descriptions) + i + 1:03d}",
-                "text": text
+                "text": text,
+                "keywords": keywords
             }
-            if request.auto_generate_keywords:
-                desc_obj["keywords"] = matcher.data_processor.extract_keywords_from_text(text)
-            else:
-                desc_obj["keywords"] = []
             desc_objects.append(desc_obj)
         
-        # 添加到系统中
-        matcher.descriptions.extend(desc_objects)
-        matcher.data_processor.descriptions = matcher.descriptions
-        matcher.data_processor.save_descriptions()
+        # 添加到系统中（同时批量追加到描述矩阵和向量库）
+        matcher.add_descriptions(desc_objects)
+        _invalidate_search_cache()
+        await matcher.data_processor.save_descriptions_async()
         
         return BatchDescriptionResponse(
             success=True,
@@ -327,7 +571,11 @@ async def generate_keywords_for_existing():
         if not matcher:
             raise HTTPException(status_code=500, detail="系统未初始化")
         
-        updated_count = matcher.data_processor.auto_generate_keywords(force_update=True)
+        updated_count = matcher.data_processor.auto_generate_keywords(force_update=True, save=False)
+        if updated_count > 0:
+            matcher.similarity_calculator.invalidate_keyword_matrix()
+            _invalidate_search_cache()
+            await matcher.data_processor.save_descriptions_async()
         
         return BaseResponse(
             success=True,
@@ -365,6 +613,7 @@ async def rebuild_vector_index():
             raise HTTPException(status_code=500, detail="系统未初始化")
         
         success = matcher.rebuild_vector_index()
+        _invalidate_search_cache()
         
         if success:
             return BaseResponse(
@@ -401,10 +650,12 @@ async def get_vector_store_stats():
 
 
 if __name__ == "__main__":
+    # loop/http 默认为auto，安装 uvicorn[standard] 后自动使用 uvloop 和 httptools
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8001,
-        reload=True,
+        reload=os.getenv("RELOAD", "false").lower() == "true",
+        workers=int(os.getenv("WORKERS", 1)),
         log_level="info"
     )
\ No newline at end of file
@@ -1,10 +1,66 @@
+import asyncio
+import contextlib
 import json
 import os
 import re
-from typing import Dict, List, Tuple
+import orjson
+from typing import Dict, List, Optional, Set, Tuple
 from collections import Counter
-import jieba
-import jieba.posseg as pseg
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+try:
+    # jieba_fast为C扩展实现的jieba，接口和分词结果相同，分词速度快数倍
+    import jieba_fast as jieba
+    import jieba_fast.posseg as pseg
+except ImportError:
+    import jieba
+    import jieba.posseg as pseg
+
+
+# 停用词列表
+_STOP_WORDS = frozenset({
+    '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这', '那', '里', '就是', '还', '把', '比', '或者', '虽然', '因为', '所以', '但是', '如果', '这样', '那样', '怎么', '什么', '哪里', '为什么', '怎样', '多少', '第一', '可以', '应该', '能够', '已经', '正在', '将要'
+})
+
+# 纯数字或标点
+_NON_WORD_RE = re.compile(r'^[\d\W]+$')
+
+# 支持的图片扩展名
+_IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'})
+
+# 有意义的词性首字母：名词n、动词v、形容词a、成语i、习语l
+_VALID_FLAG_FIRST = frozenset('nvail')
+
+
+@lru_cache(maxsize=4096)
+def _extract_keywords(text: str, max_keywords: int) -> Tuple[str, ...]:
+    """从文本中提取关键词（分词与词性标注开销较大，结果缓存复用）"""
+    # 使用词性标注进行分词
+    words = pseg.cut(text)
+    
+    # 筛选有意义的词汇（名词、动词、形容词等）
+    meaningful_words = []
+    for word, flag in words:
+        # 过滤条件（按开销从低到高排列，尽早短路）：
+        # 1. 是有意义的词性（名词n、动词v、形容词a等）
+        # 2. 长度大于1
+        # 3. 不是停用词
+        # 4. 不是纯数字或标点
+        if (flag[:1] in _VALID_FLAG_FIRST and
+            len(word) > 1 and
+            word not in _STOP_WORDS and
+            not _NON_WORD_RE.match(word)):
+            meaningful_words.append(word)
+    
+    # 统计词频并返回最高频的关键词
+    if meaningful_words:
+        word_freq = Counter(meaningful_words)
+        return tuple(word for word, freq in word_freq.most_common(max_keywords))
+    
+    # 如果没有找到有意义的词，则使用简单分词
+    simple_words = [word for word in jieba.cut(text) 
+                   if len(word) > 1 and word not in _STOP_WORDS]
+    return tuple(simple_words[:max_keywords])
 
 
 class DataProcessor:
@@ -14,14 +70,23 @@ class DataProcessor:
         self.data_dir = data_dir
         self.descriptions = []
         self.image_mappings = {}
+        # 所有关键词的缓存集合，描述数据变化时置为None
+        self._all_keywords_cache: Optional[Set[str]] = None
+        # 单线程写入队列，同步和异步保存都经过它，保证写入顺序与提交顺序一致
+        self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="data-save")
         
+    def invalidate_keyword_cache(self):
+        """描述数据变化后使关键词缓存失效"""
+        self._all_keywords_cache = None
+    
     def load_descriptions(self) -> List[Dict]:
         """加载描述词数据"""
         desc_file = os.path.join(self.data_dir, "descriptions.json")
         try:
-            with open(desc_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(desc_file, 'rb') as f:
+                data = orjson.loads(f.read())
                 self.descriptions = data.get("descriptions", [])
+                self.invalidate_keyword_cache()
                 print(f"成功加载 {len(self.descriptions)} 条描述数据")
                 return self.descriptions
         except FileNotFoundError:
@@ -39,12 +104,12 @@ class DataProcessor:
             print(f"创建图片目录: {image_dir}")
             return []
         
-        image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
-        images = []
-        
-        for filename in os.listdir(image_dir):
-            if any(filename.lower().endswith(ext) for ext in image_extensions):
-                images.append(filename)
+        # scandir的目录项自带文件类型，无需额外stat
+        with os.scandir(image_dir) as entries:
+            images = [
+                entry.name for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in _IMAGE_EXTENSIONS
+            ]
         
         print(f"发现 {len(images)} 张图片")
         return images
@@ -67,19 +132,42 @@ class DataProcessor:
         self.save_mappings()
         return mappings
     
+    @staticmethod
+    def _write_json_bytes(file_path: str, content: bytes):
+        """将序列化好的JSON先写入同目录下的临时文件再原子替换，写入中途崩溃不会截断原文件"""
+        temp_path = f"{file_path}.tmp{os.getpid()}"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, file_path)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+    
+    def _submit_write(self, file_path: str, content: bytes):
+        """提交到单线程写入队列：所有保存按提交顺序依次执行，旧快照不会覆盖新快照"""
+        return self._save_executor.submit(self._write_json_bytes, file_path, content)
+    
     def save_mappings(self):
         """保存映射关系到文件"""
         mapping_file = os.path.join(self.data_dir, "mappings.json")
-        with open(mapping_file, 'w', encoding='utf-8') as f:
-            json.dump(self.image_mappings, f, ensure_ascii=False, indent=2)
+        self._submit_write(mapping_file, orjson.dumps(self.image_mappings, option=orjson.OPT_INDENT_2)).result()
+        print(f"映射关系已保存到 {mapping_file}")
+    
+    async def save_mappings_async(self):
+        """异步保存映射关系，磁盘写入不阻塞事件循环"""
+        mapping_file = os.path.join(self.data_dir, "mappings.json")
+        # 在当前线程序列化快照，避免写入期间映射被其他请求修改
+        content = orjson.dumps(self.image_mappings, option=orjson.OPT_INDENT_2)
+        await asyncio.wrap_future(self._submit_write(mapping_file, content))
         print(f"映射关系已保存到 {mapping_file}")
     
     def load_mappings(self) -> Dict:
         """加载已保存的映射关系"""
         mapping_file = os.path.join(self.data_dir, "mappings.json")
         try:
-            with open(mapping_file, 'r', encoding='utf-8') as f:
-                self.image_mappings = json.load(f)
+            with open(mapping_file, 'rb') as f:
+                self.image_mappings = orjson.loads(f.read())
                 return self.image_mappings
         except FileNotFoundError:
             print("映射文件不存在，将创建新的映射关系")
@@ -93,55 +181,36 @@ class DataProcessor:
         """从文本中自动提取关键词"""
         if not text.strip():
             return []
+        # 同一文本会在自动生成、批量处理等流程中反复提取，结果按文本缓存
+        return list(_extract_keywords(text, max_keywords))
+    
+    def extract_keywords_batch(self, texts: List[str], max_keywords: int = 5) -> List[List[str]]:
+        """批量提取关键词，结果顺序与texts一致
         
-        # 停用词列表
-        stop_words = {
-            '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这', '那', '里', '就是', '还', '把', '比', '或者', '虽然', '因为', '所以', '但是', '如果', '这样', '那样', '怎么', '什么', '哪里', '为什么', '怎样', '多少', '第一', '可以', '应该', '能够', '已经', '正在', '将要'
-        }
-        
-        # 使用词性标注进行分词
-        words = pseg.cut(text)
-        
-        # 筛选有意义的词汇（名词、动词、形容词等）
-        meaningful_words = []
-        for word, flag in words:
-            # 过滤条件：
-            # 1. 长度大于1
-            # 2. 不是停用词
-            # 3. 是有意义的词性（名词n、动词v、形容词a等）
-            # 4. 不是纯数字或标点
-            if (len(word) > 1 and 
-                word not in stop_words and 
-                flag.startswith(('n', 'v', 'a', 'i', 'l')) and  # 名词、动词、形容词、成语、习语
-                not re.match(r'^[\d\W]+$', word)):
-                meaningful_words.append(word)
-        
-        # 统计词频并返回最高频的关键词
-        if meaningful_words:
-            word_freq = Counter(meaningful_words)
-            keywords = [word for word, freq in word_freq.most_common(max_keywords)]
-            return keywords
-        
-        # 如果没有找到有意义的词，则使用简单分词
-        simple_words = [word for word in jieba.cut(text) 
-                       if len(word) > 1 and word not in stop_words]
-        return simple_words[:max_keywords]
+        重复文本只分词一次；分词受GIL限制，多线程并不能加速，因此顺序处理
+        """
+        keywords_by_text = {}
+        for text in texts:
+            if text not in keywords_by_text:
+                keywords_by_text[text] = self.extract_keywords_from_text(text, max_keywords)
+        return [list(keywords_by_text[text]) for text in texts]
     
-    def auto_generate_keywords(self, force_update: bool = False) -> int:
+    def auto_generate_keywords(self, force_update: bool = False, save: bool = True) -> int:
         """为没有关键词的描述自动生成关键词"""
-        updated_count = 0
+        # 如果没有关键词或者强制更新
+        pending = [desc for desc in self.descriptions if not desc.get("keywords") or force_update]
+        keywords_list = self.extract_keywords_batch([desc["text"] for desc in pending])
+        updated_count = len(pending)
         
-        for desc in self.descriptions:
-            # 如果没有关键词或者强制更新
-            if not desc.get("keywords") or force_update:
-                keywords = self.extract_keywords_from_text(desc["text"])
-                desc["keywords"] = keywords
-                updated_count += 1
-                print(f"为描述 '{desc['text'][:20]}...' 生成关键词: {keywords}")
+        for desc, keywords in zip(pending, keywords_list):
+            desc["keywords"] = keywords
+            print(f"为描述 '{desc['text'][:20]}...' 生成关键词: {keywords}")
         
         if updated_count > 0:
+            self.invalidate_keyword_cache()
             # 保存更新后的描述数据
-            self.save_descriptions()
+            if save:
+                self.save_descriptions()
             print(f"共为 {updated_count} 条描述生成了关键词")
         
         return updated_count
@@ -150,8 +219,16 @@ class DataProcessor:
         """保存描述数据到文件"""
         desc_file = os.path.join(self.data_dir, "descriptions.json")
         data = {"descriptions": self.descriptions}
-        with open(desc_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.invalidate_keyword_cache()
+        self._submit_write(desc_file, orjson.dumps(data, option=orjson.OPT_INDENT_2)).result()
+        print(f"描述数据已保存到 {desc_file}")
+    
+    async def save_descriptions_async(self):
+        """异步保存描述数据，磁盘写入不阻塞事件循环"""
+        desc_file = os.path.join(self.data_dir, "descriptions.json")
+        content = orjson.dumps({"descriptions": self.descriptions}, option=orjson.OPT_INDENT_2)
+        self.invalidate_keyword_cache()
+        await asyncio.wrap_future(self._submit_write(desc_file, content))
         print(f"描述数据已保存到 {desc_file}")
     
     def process_simple_descriptions(self, descriptions_data: List[Dict]) -> List[Dict]:
@@ -181,11 +258,13 @@ class DataProcessor:
         return processed_descriptions
     
     def get_all_keywords(self) -> List[str]:
-        """获取所有关键词"""
-        all_keywords = set()
-        for desc in self.descriptions:
-            all_keywords.update(desc.get("keywords", []))
-            # 添加描述文本的分词结果
-            tokens = self.tokenize_text(desc["text"])
-            all_keywords.update(tokens)
-        return list(all_keywords)
\ No newline at end of file
+        """获取所有关键词（结果缓存，描述数据变化前无需重新分词）"""
+        if self._all_keywords_cache is None:
+            all_keywords = set()
+            for desc in self.descriptions:
+                all_keywords.update(desc.get("keywords", []))
+                # 添加描述文本的分词结果
+                tokens = self.tokenize_text(desc["text"])
+                all_keywords.update(tokens)
+            self._all_keywords_cache = all_keywords
+        return list(self._all_keywords_cache)
\ No newline at end of file
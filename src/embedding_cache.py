@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Optional
+
+
+class EmbeddingCache:
+    """文本向量的磁盘缓存（SQLite），以模型名+文本的SHA-256为键
+    
+    重启后已编码过的描述和查询直接从磁盘读取，无需再次经过语义模型
+    """
+    
+    def __init__(self, cache_file: str, model_name: str):
+        self.cache_file = cache_file
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        # 多个uvicorn工作进程可能同时读写同一缓存文件
+        self._conn = sqlite3.connect(cache_file, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def _key(self, text: str) -> bytes:
+        """缓存键包含模型名，切换模型时不会读到其他模型的向量"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).digest()
+    
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """读取单个文本的向量，未命中返回None"""
+        return self.get_many([text]).get(text)
+    
+    def put(self, text: str, embedding: np.ndarray):
+        """写入单个文本的向量"""
+        self.put_many({text: embedding})
+    
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """批量读取，只返回命中的文本"""
+        keys = {self._key(text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            # SQLite单条语句的参数数量有上限，分批查询
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[keys[key]] = np.frombuffer(vector, dtype=np.float32)
+        return found
+    
+    def put_many(self, embeddings: Dict[str, np.ndarray]):
+        """批量写入，一个事务内完成"""
+        rows = [
+            (self._key(text), np.ascontiguousarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in embeddings.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
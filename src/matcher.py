@@ -1,4 +1,5 @@
 import os
+from collections import defaultdict
 from typing import List, Dict, Tuple
 from .data_processor import DataProcessor
 from .similarity import SimilarityCalculator
@@ -7,12 +8,22 @@ from .similarity import SimilarityCalculator
 class ImageMatcher:
     """图片匹配引擎，根据描述词匹配相应图片"""
     
-    def __init__(self, data_dir: str = "data", similarity_method: str = "tfidf", use_vector_store: bool = True):
+    def __init__(self, data_dir: str = "data", similarity_method: str = "tfidf", use_vector_store: bool = True,
+                 vector_index_type: str = "flat", quantize_int8: bool = False):
         self.data_processor = DataProcessor(data_dir)
-        self.similarity_calculator = SimilarityCalculator(similarity_method, use_vector_store)
+        # 描述向量矩阵及文本向量的磁盘缓存目录
+        self.index_dir = os.path.join(data_dir, "index")
+        self.similarity_calculator = SimilarityCalculator(similarity_method, use_vector_store, vector_index_type,
+                                                          quantize_int8, self.index_dir)
         self.descriptions = []
         self.image_mappings = {}
+        # 描述ID -> 使用该描述的图片列表（image_mappings的倒排索引）
+        self.images_by_desc = defaultdict(list)
         self.use_vector_store = use_vector_store
+        self.vector_index_type = vector_index_type
+        self.quantize_int8 = quantize_int8
+        # 描述、映射、相似度方法或向量索引每次变化时递增，上层的搜索结果缓存据此判断是否过期
+        self.data_version = 0
         
         # 初始化数据
         self.initialize()
@@ -36,6 +47,10 @@ class ImageMatcher:
         self.image_mappings = self.data_processor.load_mappings()
         if not self.image_mappings and images:
             self.image_mappings = self.data_processor.create_mappings(images)
+        self._build_image_index()
+        
+        # 预先加载或构建描述向量矩阵
+        self._prepare_description_matrix()
         
         # 构建向量索引（如果使用向量库）
         if self.use_vector_store and self.descriptions:
@@ -48,6 +63,26 @@ class ImageMatcher:
         
         print(f"系统初始化完成，共有 {len(self.image_mappings)} 个图片-描述映射")
     
+    def _prepare_description_matrix(self):
+        """优先从磁盘缓存加载描述矩阵，缓存失效时重新构建并保存"""
+        if not self.descriptions:
+            return
+        
+        calculator = self.similarity_calculator
+        if calculator.load_description_matrix(self.index_dir, self.descriptions):
+            return
+        if calculator.build_description_matrix(self.descriptions):
+            calculator.save_description_matrix(self.index_dir, self.descriptions)
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """合并连续空白并去掉首尾空白，"a b" 与 " a  b " 视为同一查询"""
+        return " ".join(query.split())
+    
+    def _mark_data_changed(self):
+        """数据变化后调用，使基于 data_version 的搜索结果缓存失效"""
+        self.data_version += 1
+    
     def search_images(self, query: str, top_k: int = 5, 
                      threshold: float = 0.1) -> List[Dict]:
         """根据查询词搜索匹配的图片"""
@@ -55,6 +90,7 @@ class ImageMatcher:
             print("没有可用的描述数据")
             return []
         
+        query = self.normalize_query(query)
         print(f"正在搜索与 '{query}' 相关的图片...")
         
         # 找到相似的描述
@@ -66,16 +102,40 @@ class ImageMatcher:
             print("没有找到匹配的描述")
             return []
         
-        # 根据描述找到对应的图片
+        results = self._collect_images(similar_descriptions, top_k)
+        print(f"找到 {len(results)} 张匹配的图片")
+        return results
+
+    def search_images_batch(self, queries: List[str], top_k: int = 5,
+                            threshold: float = 0.1) -> Dict[str, List[Dict]]:
+        """批量搜索图片，规范化后相同的查询只计算一次，所有查询共用一次相似度矩阵乘法"""
+        if not self.descriptions:
+            print("没有可用的描述数据")
+            return {query: [] for query in queries}
+        
+        normalized = {query: self.normalize_query(query) for query in queries}
+        unique_queries = list(dict.fromkeys(normalized.values()))
+        similar_by_query = self.similarity_calculator.find_similar_descriptions_batch(
+            unique_queries, self.descriptions, top_k, threshold
+        )
+        results_by_normalized = {
+            query: self._collect_images(similar_descriptions, top_k)
+            for query, similar_descriptions in zip(unique_queries, similar_by_query)
+        }
+        return {query: list(results_by_normalized[normalized[query]]) for query in normalized}
+
+    def _collect_images(self, similar_descriptions: List[Tuple[Dict, float]], top_k: int) -> List[Dict]:
+        """根据相似描述找到对应的图片，返回前top_k张
+        
+        similar_descriptions已按相似度从高到低排序，同一描述的图片分数相同，
+        因此按顺序收集的结果天然有序，凑够top_k张即可停止，无需再排序
+        """
         results = []
         for desc, similarity_score in similar_descriptions:
             desc_id = desc["id"]
             
-            # 找到使用这个描述的图片
-            matching_images = [
-                img_name for img_name, mapping in self.image_mappings.items()
-                if mapping["description_id"] == desc_id
-            ]
+            # 通过倒排索引找到使用这个描述的图片
+            matching_images = self.images_by_desc.get(desc_id, ())
             
             for img_name in matching_images:
                 results.append({
@@ -85,12 +145,16 @@ class ImageMatcher:
                     "keywords": desc.get("keywords", []),
                     "similarity_score": similarity_score
                 })
+                if len(results) >= top_k:
+                    return results
         
-        # 按相似度排序
-        results.sort(key=lambda x: x["similarity_score"], reverse=True)
-        
-        print(f"找到 {len(results)} 张匹配的图片")
-        return results[:top_k]
+        return results
+
+    def _build_image_index(self):
+        """根据映射关系构建描述ID到图片的倒排索引"""
+        self.images_by_desc = defaultdict(list)
+        for img_name, mapping in self.image_mappings.items():
+            self.images_by_desc[mapping["description_id"]].append(img_name)
     
     def get_image_description(self, image_name: str) -> Dict:
         """获取指定图片的描述信息"""
@@ -99,8 +163,8 @@ class ImageMatcher:
         return {}
     
     def add_image_description(self, image_name: str, description: str, 
-                            keywords: List[str] = None) -> bool:
-        """为图片添加新的描述"""
+                            keywords: List[str] = None, save: bool = True) -> bool:
+        """为图片添加新的描述（save=False时由调用方负责保存映射关系）"""
         try:
             # 生成新的描述ID
             desc_id = f"desc_{len(self.descriptions) + 1:03d}"
@@ -113,7 +177,13 @@ class ImageMatcher:
             }
             self.descriptions.append(new_desc)
             
+            # 图片原有的描述不再指向该图片
+            old_mapping = self.image_mappings.get(image_name)
+            if old_mapping:
+                self.images_by_desc[old_mapping["description_id"]].remove(image_name)
+            
             # 更新映射关系
+            self.images_by_desc[desc_id].append(image_name)
             self.image_mappings[image_name] = {
                 "description_id": desc_id,
                 "description_text": description,
@@ -123,11 +193,13 @@ class ImageMatcher:
             # 保存更新
             self.data_processor.descriptions = self.descriptions
             self.data_processor.image_mappings = self.image_mappings
-            self.data_processor.save_mappings()
+            self.data_processor.invalidate_keyword_cache()
+            if save:
+                self.data_processor.save_mappings()
             
-            # 如果使用向量库，添加到索引
-            if self.use_vector_store:
-                self.similarity_calculator.add_description_to_index(new_desc)
+            # 追加到描述矩阵（以及向量库索引）
+            self.similarity_calculator.add_description_to_index(new_desc)
+            self._mark_data_changed()
             
             print(f"成功为图片 {image_name} 添加描述")
             return True
@@ -136,9 +208,22 @@ class ImageMatcher:
             print(f"添加描述失败: {e}")
             return False
     
+    def add_descriptions(self, descriptions: List[Dict]):
+        """批量添加描述：一次写入描述矩阵和向量库（语义向量批量编码），由调用方负责保存描述数据"""
+        self.descriptions.extend(descriptions)
+        self.data_processor.descriptions = self.descriptions
+        self.data_processor.invalidate_keyword_cache()
+        self.similarity_calculator.add_descriptions_to_index(descriptions)
+        self._mark_data_changed()
+    
     def update_similarity_method(self, method: str):
         """更新相似度计算方法"""
-        self.similarity_calculator = SimilarityCalculator(method, self.use_vector_store)
+        self.similarity_calculator = SimilarityCalculator(method, self.use_vector_store, self.vector_index_type,
+                                                          self.quantize_int8, self.index_dir)
+        self._mark_data_changed()
+        
+        # 新的计算方法需要对应的描述矩阵
+        self._prepare_description_matrix()
         
         # 如果切换到向量方法，需要重建索引
         if method == "sentence_transformer" and self.use_vector_store and self.descriptions:
@@ -174,6 +259,7 @@ class ImageMatcher:
         
         print("开始重建向量索引...")
         success = self.similarity_calculator.rebuild_vector_index()
+        self._mark_data_changed()
         
         if success:
             print("✓ 向量索引重建完成")
@@ -28,6 +28,21 @@ class SearchResponse(BaseModel):
     results: List[ImageResult] = Field(default_factory=list, description="搜索结果")
 
 
+class BatchSearchRequest(BaseModel):
+    """批量搜索请求模型"""
+    queries: List[str] = Field(..., description="搜索关键词列表", min_length=1, max_length=50)
+    top_k: int = Field(5, description="每个查询返回结果数量", ge=1, le=20)
+    threshold: float = Field(0.1, description="相似度阈值", ge=0.0, le=1.0)
+
+
+class BatchSearchResponse(BaseModel):
+    """批量搜索响应模型"""
+    success: bool = Field(..., description="请求是否成功")
+    message: str = Field(..., description="响应消息")
+    total_queries: int = Field(..., description="查询总数")
+    results_by_query: Dict[str, List[ImageResult]] = Field(default_factory=dict, description="按查询分组的搜索结果")
+
+
 class AddDescriptionRequest(BaseModel):
     """添加描述请求模型"""
     image_name: str = Field(..., description="图片文件名", min_length=1)
@@ -1,57 +1,218 @@
+import os
+import json
+import pickle
+import hashlib
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-import jieba
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, TfidfTransformer
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.metrics.pairwise import linear_kernel
+from scipy.sparse import csr_matrix, issparse, save_npz, load_npz, vstack as sparse_vstack
+try:
+    # jieba_fast为C扩展实现的jieba，接口和分词结果相同，分词速度快数倍
+    import jieba_fast as jieba
+except ImportError:
+    import jieba
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Tuple, Dict
-from .vector_store import VectorStore, EnhancedSimilarityCalculator
+from .vector_store import VectorStore, EnhancedSimilarityCalculator, SENTENCE_MODEL_NAME, encode_texts, \
+    load_sentence_model, MissingHDF5PluginError
+from .embedding_cache import EmbeddingCache
+
+
+# PyTorch推理线程数是否已配置（进程内只配置一次）
+_threads_configured = False
+
+
+def _configure_threads():
+    """按工作进程数平分PyTorch推理线程数
+    
+    以PyTorch默认的线程数（物理核数）为基准，不用 os.cpu_count() 的逻辑核数，避免超线程超订；
+    用户通过OMP_NUM_THREADS/MKL_NUM_THREADS显式指定时不做修改
+    """
+    global _threads_configured
+    if _threads_configured:
+        return
+    _threads_configured = True
+    
+    if os.getenv("OMP_NUM_THREADS") or os.getenv("MKL_NUM_THREADS"):
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    
+    workers = max(1, int(os.getenv("WORKERS", 1)))
+    if workers > 1:
+        torch.set_num_threads(max(1, torch.get_num_threads() // workers))
+
+
+@lru_cache(maxsize=8192)
+def _jieba_cut(text: str) -> Tuple[str, ...]:
+    """jieba分词结果缓存，重复的查询和描述无需再次分词"""
+    return tuple(jieba.cut(text))
+
+
+def _jieba_tokenize(text: str) -> List[str]:
+    """中文分词（模块级函数，保证TF-IDF向量化器可以被pickle持久化）"""
+    return list(_jieba_cut(text))
+
+
+def _new_tfidf_vectorizer() -> TfidfVectorizer:
+    """创建使用jieba分词的TF-IDF向量化器"""
+    return TfidfVectorizer(tokenizer=_jieba_tokenize, lowercase=False, token_pattern=None)
+
+
+def _new_hashing_tfidf_vectorizer() -> Pipeline:
+    """创建基于特征哈希的TF-IDF向量化器
+    
+    哈希空间固定，不依赖拟合得到的词表，新描述出现新词时也可以直接transform后追加到矩阵
+    """
+    return make_pipeline(
+        HashingVectorizer(n_features=2 ** 18, tokenizer=_jieba_tokenize, lowercase=False,
+                          token_pattern=None, alternate_sign=False, norm=None),
+        TfidfTransformer()
+    )
+
+
+def _atomic_write(file_path: str, write) -> None:
+    """先写入同目录下的临时文件再原子替换
+    
+    其他工作进程已通过mmap映射的旧文件不会被就地覆盖，也不会读到写了一半的文件
+    """
+    temp_path = f"{file_path}.tmp{os.getpid()}"
+    try:
+        with open(temp_path, 'wb') as f:
+            write(f)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _quantize_rows_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按行对称量化为int8，返回 (int8矩阵, 每行的float32缩放系数)"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+    return np.ascontiguousarray(quantized), scales.astype(np.float32)
+
+
+def _int8_scores(query_matrix: np.ndarray, quantized: np.ndarray, scales: np.ndarray,
+                 block_rows: int = 1024) -> np.ndarray:
+    """计算float32查询矩阵与int8描述矩阵的点积
+    
+    numpy没有int8 GEMM，整体转换会产生与原矩阵等大的临时数组，
+    因此按行分块反量化，每块都能留在CPU缓存中并走float32 BLAS
+    """
+    scores = np.empty((query_matrix.shape[0], quantized.shape[0]), dtype=np.float32)
+    for start in range(0, quantized.shape[0], block_rows):
+        block = quantized[start:start + block_rows].astype(np.float32)
+        scores[:, start:start + block_rows] = query_matrix @ block.T
+    scores *= scales
+    return scores
+
+
+def _dense_scores(query_matrix: np.ndarray, desc_matrix: np.ndarray, desc_scales=None) -> np.ndarray:
+    """计算查询矩阵与稠密描述矩阵（float32或int8）的点积"""
+    if desc_scales is not None:
+        return _int8_scores(query_matrix, desc_matrix, desc_scales)
+    return query_matrix @ desc_matrix.T
 
 
 class SimilarityCalculator:
     """相似度计算器，支持多种相似度计算方法"""
     
-    def __init__(self, method: str = "tfidf", use_vector_store: bool = True):
+    # 查询向量LRU缓存容量
+    QUERY_CACHE_SIZE = 1024
+    
+    # 批量编码描述时每批的文本数量
+    ENCODE_BATCH_SIZE = 64
+    
+    # TF-IDF矩阵追加的行数超过拟合时行数的该比例后，下次搜索时重新拟合IDF
+    TFIDF_REFIT_RATIO = 0.2
+    
+    def __init__(self, method: str = "tfidf", use_vector_store: bool = True,
+                 vector_index_type: str = "flat", quantize_int8: bool = False,
+                 embedding_cache_dir: str = None):
         self.method = method
         self.use_vector_store = use_vector_store
+        self.vector_index_type = vector_index_type
+        # 语义向量矩阵按行量化为int8，内存占用降为1/4
+        self.quantize_int8 = quantize_int8
         self.vectorizer = None
         self.sentence_model = None
         self.enhanced_calculator = None
+        # 文本向量的磁盘缓存（仅语义模型使用）
+        self.embedding_cache = None
+        
+        # 描述向量矩阵（TF-IDF为稀疏矩阵，语义模型为float32稠密矩阵），行已L2归一化
+        self.desc_matrix = None
+        # int8量化时每行的缩放系数（未量化时为None）
+        self.desc_scales = None
+        # 最近一次拟合TF-IDF时的描述数，用于判断追加行数是否需要重新拟合IDF
+        self._tfidf_fitted_rows = 0
+        
+        # 描述-关键词关联矩阵及其词表，用于批量计算关键词Jaccard相似度
+        self.keyword_matrix = None
+        self.keyword_vocabulary = {}
+        self.keyword_counts = None
+        
+        # calculate_tfidf_similarity 使用的 (文本元组, 向量化器, TF-IDF矩阵)
+        self._text_tfidf_cache = None
+        # calculate_semantic_similarity 使用的 (文本元组, 归一化向量矩阵)
+        self._text_embedding_cache = None
         
-        if method == "sentence_transformer" and use_vector_store:
-            # 使用增强的计算器（带向量库）
+        # 查询文本 -> 查询向量，热门查询无需重复分词/编码
+        self._query_vector_cache = OrderedDict()
+        
+        if method == "sentence_transformer":
+            _configure_threads()
+            self._init_semantic_backend(embedding_cache_dir)
+        
+        # 只有最终使用TF-IDF时才创建向量化器
+        if self.method == "tfidf":
+            self.vectorizer = _new_hashing_tfidf_vectorizer()
+    
+    def _init_semantic_backend(self, embedding_cache_dir: str = None):
+        """加载语义模型：优先使用带向量库的增强计算器，其次直接加载模型，都失败时回退到TF-IDF"""
+        if self.use_vector_store:
             try:
-                self.enhanced_calculator = EnhancedSimilarityCalculator(method)
-                print("✓ 启用向量库加速搜索")
+                self.enhanced_calculator = EnhancedSimilarityCalculator(self.method, index_type=self.vector_index_type)
+            except MissingHDF5PluginError:
+                raise
             except Exception as e:
                 print(f"向量库初始化失败: {e}")
                 print("回退到传统方法")
+                self.enhanced_calculator = None
+            else:
+                if self.enhanced_calculator.sentence_model is not None:
+                    self.embedding_cache = self.enhanced_calculator.embedding_cache
+                    print("✓ 启用向量库加速搜索")
+                    return
+                # 语义模型加载失败，无需再次尝试
+                self.enhanced_calculator = None
                 self.use_vector_store = False
+                self.method = "tfidf"
+                return
+            self.use_vector_store = False
         
-        if not self.use_vector_store or method == "tfidf":
-            # 传统方法
-            if method == "tfidf":
-                self.vectorizer = TfidfVectorizer(
-                    tokenizer=self._tokenize,
-                    lowercase=False,
-                    token_pattern=None
+        try:
+            # 使用中文语义模型
+            self.sentence_model = load_sentence_model()
+            if embedding_cache_dir:
+                self.embedding_cache = EmbeddingCache(
+                    os.path.join(embedding_cache_dir, "embedding_cache.sqlite3"), SENTENCE_MODEL_NAME
                 )
-            elif method == "sentence_transformer":
-                try:
-                    # 使用中文语义模型
-                    self.sentence_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-                except Exception as e:
-                    print(f"加载语义模型失败: {e}")
-                    print("回退到TF-IDF方法")
-                    self.method = "tfidf"
-                    self.vectorizer = TfidfVectorizer(
-                        tokenizer=self._tokenize,
-                        lowercase=False,
-                        token_pattern=None
-                    )
+        except Exception as e:
+            print(f"加载语义模型失败: {e}")
+            print("回退到TF-IDF方法")
+            self.sentence_model = None
+            self.method = "tfidf"
     
     def _tokenize(self, text: str) -> List[str]:
         """中文分词"""
-        return list(jieba.cut(text))
+        return _jieba_tokenize(text)
     
     def build_vector_index(self, descriptions: List[Dict]) -> bool:
         """构建向量索引"""
@@ -59,18 +220,205 @@ class SimilarityCalculator:
             return self.enhanced_calculator.build_vector_index(descriptions)
         return False
     
-    def calculate_tfidf_similarity(self, query: str, texts: List[str]) -> List[float]:
-        """使用TF-IDF计算相似度"""
-        all_texts = [query] + texts
+    def _get_sentence_model(self):
+        """获取可用的语义模型（传统方法或向量库中加载的模型）"""
+        if self.sentence_model is not None:
+            return self.sentence_model
+        if self.enhanced_calculator:
+            return self.enhanced_calculator.sentence_model
+        return None
+    
+    def _encode(self, sentence_model, texts: List[str]) -> np.ndarray:
+        """批量编码文本为L2归一化的float32向量（C连续），零向量保持为零"""
+        return encode_texts(
+            sentence_model,
+            texts,
+            batch_size=self.ENCODE_BATCH_SIZE,
+            cache=self.embedding_cache,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+    
+    def build_description_matrix(self, descriptions: List[Dict]) -> bool:
+        """一次性向量化所有描述，查询时只需一次矩阵乘法"""
+        if not descriptions:
+            self.desc_matrix = None
+            self.desc_scales = None
+            return False
+        
+        texts = [desc["text"] for desc in descriptions]
+        sentence_model = self._get_sentence_model()
+        self.desc_scales = None
+        
+        if self.method == "sentence_transformer" and sentence_model is not None:
+            # 编码时已做L2归一化，无需再次归一化
+            self.desc_matrix = self._encode(sentence_model, texts)
+            if self.quantize_int8:
+                self.desc_matrix, self.desc_scales = _quantize_rows_int8(self.desc_matrix)
+        else:
+            # TfidfTransformer默认对每行做L2归一化
+            self.desc_matrix = self.vectorizer.fit_transform(texts).tocsr()
+            self._tfidf_fitted_rows = len(texts)
+        
+        # 词表可能已变化，旧的查询向量失效
+        self._query_vector_cache.clear()
+        
+        print(f"✓ 描述向量矩阵构建完成: {self.desc_matrix.shape}")
+        return True
+    
+    def _descriptions_fingerprint(self, descriptions: List[Dict]) -> str:
+        """计算描述文本的内容指纹，用于判断缓存的描述矩阵是否仍然有效"""
+        digest = hashlib.sha1(self.method.encode('utf-8'))
+        if self.method == "sentence_transformer":
+            digest.update(SENTENCE_MODEL_NAME.encode('utf-8'))
+            if self.quantize_int8:
+                digest.update(b'\0int8')
+        else:
+            digest.update(b'\0hashing')
+        for desc in descriptions:
+            digest.update(b'\0' + desc["id"].encode('utf-8'))
+            digest.update(b'\0' + desc["text"].encode('utf-8'))
+        return digest.hexdigest()
+    
+    def save_description_matrix(self, cache_dir: str, descriptions: List[Dict]) -> bool:
+        """将描述矩阵（及TF-IDF向量化器）保存到磁盘，下次启动无需重新计算"""
+        if self.desc_matrix is None:
+            return False
+        
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            if self.method == "sentence_transformer":
+                _atomic_write(os.path.join(cache_dir, "embeddings.npy"),
+                              lambda f: np.save(f, self.desc_matrix))
+                if self.desc_scales is not None:
+                    _atomic_write(os.path.join(cache_dir, "embedding_scales.npy"),
+                                  lambda f: np.save(f, self.desc_scales))
+            else:
+                _atomic_write(os.path.join(cache_dir, "tfidf_matrix.npz"),
+                              lambda f: save_npz(f, self.desc_matrix))
+                _atomic_write(os.path.join(cache_dir, "tfidf_vectorizer.pkl"),
+                              lambda f: pickle.dump(self.vectorizer, f))
+            
+            # 元数据最后写入，保证其存在时矩阵文件已完整
+            meta = {
+                "fingerprint": self._descriptions_fingerprint(descriptions),
+                "rows": self.desc_matrix.shape[0]
+            }
+            _atomic_write(os.path.join(cache_dir, f"{self.method}_meta.json"),
+                          lambda f: f.write(json.dumps(meta).encode('utf-8')))
+            print(f"✓ 描述向量矩阵已保存到 {cache_dir}")
+            return True
+        except Exception as e:
+            print(f"保存描述向量矩阵失败: {e}")
+            return False
+    
+    def load_description_matrix(self, cache_dir: str, descriptions: List[Dict]) -> bool:
+        """从磁盘加载描述矩阵，描述内容发生变化时返回False"""
+        meta_file = os.path.join(cache_dir, f"{self.method}_meta.json")
+        if not descriptions or not os.path.exists(meta_file):
+            return False
+        
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") != self._descriptions_fingerprint(descriptions):
+                print("描述数据已变化，需要重新构建描述向量矩阵")
+                return False
+            
+            if self.method == "sentence_transformer":
+                # 以只读mmap方式加载，多个uvicorn工作进程共享同一份物理内存
+                embeddings = np.load(os.path.join(cache_dir, "embeddings.npy"), mmap_mode='r')
+                if self.quantize_int8:
+                    self.desc_matrix = np.ascontiguousarray(embeddings, dtype=np.int8)
+                    self.desc_scales = np.load(os.path.join(cache_dir, "embedding_scales.npy"))
+                else:
+                    self.desc_matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+                    self.desc_scales = None
+            else:
+                with open(os.path.join(cache_dir, "tfidf_vectorizer.pkl"), 'rb') as f:
+                    self.vectorizer = pickle.load(f)
+                self.desc_matrix = load_npz(os.path.join(cache_dir, "tfidf_matrix.npz")).tocsr()
+                self._tfidf_fitted_rows = self.desc_matrix.shape[0]
+            
+            if self.desc_matrix.shape[0] != meta.get("rows"):
+                # 其他进程正在写入新的缓存
+                print("描述向量矩阵缓存不完整，需要重新构建")
+                self.desc_matrix = None
+                self.desc_scales = None
+                return False
+            
+            self._query_vector_cache.clear()
+            print(f"✓ 从缓存加载描述向量矩阵: {self.desc_matrix.shape}")
+            return True
+        except Exception as e:
+            print(f"加载描述向量矩阵缓存失败: {e}")
+            return False
+    
+    def _vectorize_query(self, query: str):
+        """将查询向量化到与描述矩阵相同的空间（带LRU缓存）"""
+        return self._vectorize_queries([query])[0]
+    
+    def _vectorize_queries(self, queries: List[str]) -> list:
+        """批量向量化查询，每个查询返回一行；未命中LRU缓存的查询合并为一次编码
+        
+        这是查询向量唯一的内存缓存，向量库搜索也使用这里的结果
+        """
+        keys = [query.strip() for query in queries]
+        missing = [key for key in dict.fromkeys(keys) if key not in self._query_vector_cache]
+        if missing:
+            sentence_model = self._get_sentence_model()
+            if self.method == "sentence_transformer" and sentence_model is not None:
+                encoded = self._encode(sentence_model, missing)
+                vectors = [encoded[i:i + 1] for i in range(len(missing))]
+            else:
+                vectors = [self.vectorizer.transform([key]) for key in missing]
+            self._query_vector_cache.update(zip(missing, vectors))
+        
+        query_vectors = []
+        for key in keys:
+            self._query_vector_cache.move_to_end(key)
+            query_vectors.append(self._query_vector_cache[key])
+        while len(self._query_vector_cache) > self.QUERY_CACHE_SIZE:
+            self._query_vector_cache.popitem(last=False)
+        return query_vectors
+    
+    def score_descriptions(self, query: str, descriptions: List[Dict]) -> np.ndarray:
+        """计算查询与所有描述的余弦相似度"""
+        return self.score_descriptions_batch([query], descriptions)[0]
+    
+    def score_descriptions_batch(self, queries: List[str], descriptions: List[Dict]) -> np.ndarray:
+        """批量计算多个查询与所有描述的余弦相似度，返回 (查询数, 描述数) 的矩阵
+        
+        所有查询向量堆叠成一个矩阵后只做一次矩阵乘法，比逐个查询计算更高效
+        """
+        if self.desc_matrix is None or self.desc_matrix.shape[0] != len(descriptions):
+            # 描述列表发生变化，重建矩阵
+            self.build_description_matrix(descriptions)
+        
+        query_vectors = self._vectorize_queries(queries)
+        if issparse(self.desc_matrix):
+            query_matrix = sparse_vstack(query_vectors, format='csr')
+        else:
+            query_matrix = np.vstack(query_vectors)
         
-        # 构建TF-IDF矩阵
-        tfidf_matrix = self.vectorizer.fit_transform(all_texts)
+        if issparse(self.desc_matrix):
+            return (query_matrix @ self.desc_matrix.T).toarray()
         
-        # 计算查询与所有文本的余弦相似度
-        query_vector = tfidf_matrix[0:1]
-        text_vectors = tfidf_matrix[1:]
+        # 单次矩阵乘法，由多线程BLAS在描述行上并行；外层再加线程池会与BLAS线程叠加造成超订
+        return _dense_scores(query_matrix, self.desc_matrix, self.desc_scales)
+    
+    def calculate_tfidf_similarity(self, query: str, texts: List[str]) -> List[float]:
+        """使用TF-IDF计算相似度"""
+        # 同一组文本只拟合一次，之后每次查询只需对查询做transform
+        texts_key = tuple(texts)
+        if self._text_tfidf_cache is None or self._text_tfidf_cache[0] != texts_key:
+            vectorizer = _new_tfidf_vectorizer()
+            self._text_tfidf_cache = (texts_key, vectorizer, vectorizer.fit_transform(texts))
+        _, vectorizer, text_vectors = self._text_tfidf_cache
         
-        similarities = cosine_similarity(query_vector, text_vectors)[0]
+        # TF-IDF向量已L2归一化，点积即余弦相似度
+        query_vector = vectorizer.transform([query])
+        similarities = linear_kernel(query_vector, text_vectors)[0]
         return similarities.tolist()
     
     def calculate_semantic_similarity(self, query: str, texts: List[str]) -> List[float]:
@@ -79,12 +427,15 @@ class SimilarityCalculator:
             return self.calculate_tfidf_similarity(query, texts)
         
         try:
-            # 编码查询和文本
-            query_embedding = self.sentence_model.encode([query])
-            text_embeddings = self.sentence_model.encode(texts)
+            # 同一组文本只编码一次，之后每次查询只需编码查询
+            texts_key = tuple(texts)
+            if self._text_embedding_cache is None or self._text_embedding_cache[0] != texts_key:
+                self._text_embedding_cache = (texts_key, self._encode(self.sentence_model, texts))
+            text_embeddings = self._text_embedding_cache[1]
             
-            # 计算余弦相似度
-            similarities = cosine_similarity(query_embedding, text_embeddings)[0]
+            # 向量已归一化，点积即余弦相似度
+            query_embedding = self._encode(self.sentence_model, [query])
+            similarities = linear_kernel(query_embedding, text_embeddings)[0]
             return similarities.tolist()
         except Exception as e:
             print(f"语义相似度计算失败: {e}")
@@ -116,21 +467,11 @@ class SimilarityCalculator:
             try:
                 # 使用向量库进行快速搜索
                 vector_results = self.enhanced_calculator.search_similar_vectors(
-                    query, top_k=top_k, threshold=threshold
+                    query, top_k=top_k, threshold=threshold, query_vector=self._vectorize_query(query)
                 )
                 
                 if vector_results:
-                    # 转换格式以匹配原有接口
-                    converted_results = []
-                    for meta, score in vector_results:
-                        # 从元数据重构描述对象
-                        desc_obj = {
-                            'id': meta['id'],
-                            'text': meta['text'],
-                            'keywords': meta.get('keywords', [])
-                        }
-                        converted_results.append((desc_obj, score))
-                    
+                    converted_results = self._convert_vector_results(vector_results)
                     print(f"✓ 向量库搜索找到 {len(converted_results)} 个结果")
                     return converted_results
                 
@@ -140,38 +481,171 @@ class SimilarityCalculator:
         # 传统搜索方法
         print("使用传统相似度计算方法")
         
-        # 提取描述文本
-        texts = [desc["text"] for desc in descriptions]
+        # 与预先构建的描述矩阵做一次矩阵乘法得到所有相似度
+        similarities = self.score_descriptions(query, descriptions)
+        return self._rank_descriptions(query, descriptions, similarities, top_k, threshold)
+    
+    def find_similar_descriptions_batch(self, queries: List[str], descriptions: List[Dict],
+                                        top_k: int = 5, threshold: float = 0.1) -> List[List[Tuple[Dict, float]]]:
+        """批量查找与多个查询最相似的描述，结果顺序与queries一致"""
+        if not queries or not descriptions:
+            return [[] for _ in queries]
         
-        # 计算相似度
-        if self.method == "sentence_transformer":
-            similarities = self.calculate_semantic_similarity(query, texts)
-        else:
-            similarities = self.calculate_tfidf_similarity(query, texts)
+        # 向量库一次检索所有查询，没有结果的查询再由传统方法处理
+        results_by_query = {}
+        if self.enhanced_calculator and self.method == "sentence_transformer":
+            try:
+                vector_results = self.enhanced_calculator.search_similar_vectors_batch(
+                    queries, top_k=top_k, threshold=threshold,
+                    query_vectors=np.vstack(self._vectorize_queries(queries))
+                )
+                for query, query_results in zip(queries, vector_results):
+                    if query_results:
+                        results_by_query[query] = self._convert_vector_results(query_results)
+            except Exception as e:
+                print(f"向量库搜索失败，回退到传统方法: {e}")
+        
+        remaining = [query for query in queries if query not in results_by_query]
+        if remaining:
+            print(f"使用传统相似度计算方法批量处理 {len(remaining)} 个查询")
+            
+            # 所有查询共用一次矩阵乘法
+            similarity_matrix = self.score_descriptions_batch(remaining, descriptions)
+            for query, similarities in zip(remaining, similarity_matrix):
+                results_by_query[query] = self._rank_descriptions(query, descriptions, similarities,
+                                                                  top_k, threshold)
+        
+        return [results_by_query[query] for query in queries]
+    
+    @staticmethod
+    def _convert_vector_results(vector_results: List[Tuple[Dict, float]]) -> List[Tuple[Dict, float]]:
+        """将向量库的 (元数据, 分数) 结果转换为 (描述对象, 分数)，以匹配原有接口"""
+        return [
+            ({'id': meta['id'], 'text': meta['text'], 'keywords': meta.get('keywords', [])}, score)
+            for meta, score in vector_results
+        ]
+    
+    def _rank_descriptions(self, query: str, descriptions: List[Dict], similarities: np.ndarray,
+                           top_k: int, threshold: float) -> List[Tuple[Dict, float]]:
+        """结合关键词相似度对描述打分，返回超过阈值的top_k结果"""
+        combined_scores = 0.7 * np.asarray(similarities, dtype=np.float64)
         
-        # 结合关键词相似度
-        query_keywords = self._tokenize(query)
-        combined_scores = []
+        # 关键词相似度最大为1，即使关键词完全匹配也达不到阈值的描述无需计算关键词相似度
+        rows = np.flatnonzero(combined_scores + 0.3 >= threshold)
+        if len(rows) == 0:
+            return []
         
-        for i, (desc, sim_score) in enumerate(zip(descriptions, similarities)):
-            keyword_sim = self.calculate_keyword_similarity(
-                query_keywords, desc.get("keywords", [])
-            )
-            # 加权组合两种相似度
-            combined_score = 0.7 * sim_score + 0.3 * keyword_sim
-            combined_scores.append((desc, combined_score))
+        # 结合关键词相似度，加权组合两种相似度
+        if len(rows) == len(combined_scores):
+            combined_scores += 0.3 * self.keyword_similarities(self._tokenize(query), descriptions)
+        else:
+            combined_scores[rows] += 0.3 * self.keyword_similarities(self._tokenize(query), descriptions, rows)
         
         # 过滤低于阈值的结果
-        filtered_results = [(desc, score) for desc, score in combined_scores if score >= threshold]
+        candidates = np.flatnonzero(combined_scores >= threshold)
         
-        # 按相似度排序并返回top_k
-        filtered_results.sort(key=lambda x: x[1], reverse=True)
-        return filtered_results[:top_k]
+        # 候选较多时先用partition在O(N)内找到第top_k大的分数，只保留不低于它的候选再排序
+        # （保留与之同分的全部候选，保证同分时的取舍与完整排序一致）
+        if len(candidates) > top_k:
+            candidate_scores = combined_scores[candidates]
+            kth_score = -np.partition(-candidate_scores, top_k - 1)[top_k - 1]
+            candidates = candidates[candidate_scores >= kth_score]
+        
+        # 按相似度排序（稳定排序，同分时保持描述原有顺序）
+        order = candidates[np.argsort(-combined_scores[candidates], kind='stable')][:top_k]
+        return [(descriptions[i], combined_scores[i]) for i in order]
+    
+    def build_keyword_matrix(self, descriptions: List[Dict]):
+        """构建描述-关键词的0/1稀疏关联矩阵（CSR），用于向量化计算Jaccard相似度"""
+        vocabulary = {}
+        indices = []
+        indptr = [0]
+        for desc in descriptions:
+            for keyword in set(desc.get("keywords", [])):
+                indices.append(vocabulary.setdefault(keyword, len(vocabulary)))
+            indptr.append(len(indices))
+        
+        self.keyword_matrix = csr_matrix(
+            (np.ones(len(indices), dtype=np.float64), indices, indptr),
+            shape=(len(descriptions), len(vocabulary))
+        )
+        self.keyword_vocabulary = vocabulary
+        # 每个描述的关键词集合大小
+        self.keyword_counts = np.diff(indptr)
+    
+    def invalidate_keyword_matrix(self):
+        """描述的关键词被修改后调用，下次搜索时重建关联矩阵"""
+        self.keyword_matrix = None
+    
+    def keyword_similarities(self, query_keywords: List[str], descriptions: List[Dict],
+                             rows: np.ndarray = None) -> np.ndarray:
+        """一次稀疏矩阵向量乘法计算查询与描述关键词的Jaccard相似度
+        
+        指定rows时只计算这些行（按rows的顺序返回），否则计算所有描述
+        """
+        if self.keyword_matrix is None or self.keyword_matrix.shape[0] != len(descriptions):
+            self.build_keyword_matrix(descriptions)
+        
+        query_set = set(query_keywords)
+        query_vector = np.zeros(self.keyword_matrix.shape[1], dtype=np.float64)
+        query_vector[[self.keyword_vocabulary[kw] for kw in query_set if kw in self.keyword_vocabulary]] = 1.0
+        
+        keyword_matrix, keyword_counts = self.keyword_matrix, self.keyword_counts
+        if rows is not None:
+            keyword_matrix, keyword_counts = keyword_matrix[rows], keyword_counts[rows]
+        
+        # |A∩B| / (|A| + |B| - |A∩B|)
+        intersection = keyword_matrix @ query_vector
+        union = keyword_counts + len(query_set) - intersection
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    def append_description_vector(self, description: Dict) -> bool:
+        """将新描述追加到已构建的描述矩阵"""
+        return self.append_description_vectors([description])
+    
+    def append_description_vectors(self, descriptions: List[Dict]) -> bool:
+        """将新描述追加到已构建的描述矩阵，无需重新拟合全部描述
+        
+        TF-IDF使用哈希特征，新描述直接transform后追加；IDF沿用上次拟合的结果，
+        追加的行数超过 TFIDF_REFIT_RATIO 后清空矩阵，下次搜索时重新拟合
+        """
+        if self.desc_matrix is None:
+            return False
+        if not descriptions:
+            return True
+        texts = [desc["text"] for desc in descriptions]
+        
+        if issparse(self.desc_matrix):
+            num_rows = self.desc_matrix.shape[0]
+            if num_rows - self._tfidf_fitted_rows >= self.TFIDF_REFIT_RATIO * max(self._tfidf_fitted_rows, 1):
+                self.desc_matrix = None
+                return False
+            rows = self.vectorizer.transform(texts)
+            self.desc_matrix = sparse_vstack([self.desc_matrix, rows], format='csr')
+            return True
+        
+        # 语义向量只需编码新描述
+        sentence_model = self._get_sentence_model()
+        if sentence_model is None:
+            self.desc_matrix = None
+            return False
+        rows = self._encode(sentence_model, texts)
+        if self.desc_scales is not None:
+            rows, row_scales = _quantize_rows_int8(rows)
+            self.desc_scales = np.concatenate([self.desc_scales, row_scales])
+        self.desc_matrix = np.vstack([self.desc_matrix, rows])
+        return True
     
     def add_description_to_index(self, description: Dict) -> bool:
-        """添加描述到向量索引"""
+        """添加描述到描述矩阵和向量索引"""
+        return self.add_descriptions_to_index([description])
+    
+    def add_descriptions_to_index(self, descriptions: List[Dict]) -> bool:
+        """批量添加描述到描述矩阵和向量索引，语义向量一次批量编码"""
+        self.append_description_vectors(descriptions)
+        self.invalidate_keyword_matrix()
         if self.enhanced_calculator:
-            return self.enhanced_calculator.add_description_to_index(description)
+            return self.enhanced_calculator.add_descriptions_to_index(descriptions)
         return False
     
     def get_vector_store_stats(self) -> Dict:
@@ -1,22 +1,171 @@
 import os
-import json
+import orjson
 import pickle
+import contextlib
+import hashlib
+import atexit
+import functools
+import threading
+import weakref
 import numpy as np
 import faiss
 import h5py
+try:
+    # 导入即向HDF5注册bitshuffle等压缩过滤器（可选依赖）
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 from typing import List, Dict, Tuple, Optional, Any
 from sentence_transformers import SentenceTransformer
 from sklearn.feature_extraction.text import TfidfVectorizer
-import jieba
+try:
+    import jieba_fast as jieba
+except ImportError:
+    import jieba
 from datetime import datetime
+from .embedding_cache import EmbeddingCache
+
+
+# 默认使用的中文语义模型
+SENTENCE_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+# 语义模型推理后端：torch 或 onnx（需要安装 optimum[onnxruntime]，CPU推理明显更快）
+SENTENCE_BACKEND = os.getenv("SENTENCE_BACKEND", "torch").lower()
+
+
+def load_sentence_model() -> SentenceTransformer:
+    """加载语义模型，ONNX Runtime后端不可用时回退到PyTorch"""
+    if SENTENCE_BACKEND == "onnx":
+        try:
+            model = SentenceTransformer(SENTENCE_MODEL_NAME, backend="onnx")
+            print("✓ 语义模型使用ONNX Runtime后端")
+            return model
+        except Exception as e:
+            print(f"ONNX后端加载失败，回退到PyTorch: {e}")
+    return SentenceTransformer(SENTENCE_MODEL_NAME)
+
+
+# bitshuffle压缩过滤器在HDF5中注册的ID
+H5_BITSHUFFLE_FILTER = 32008
+
+
+class MissingHDF5PluginError(RuntimeError):
+    """vectors.h5 使用了bitshuffle压缩，但当前环境没有安装hdf5plugin"""
+
+
+def _id_hash(vector_id: str) -> int:
+    """将字符串ID哈希为int64（BLAKE2b取8字节），跨进程稳定，不受PYTHONHASHSEED影响"""
+    return int.from_bytes(hashlib.blake2b(vector_id.encode('utf-8'), digest_size=8).digest(),
+                          'little', signed=True)
+
+
+def _grow_buffer(buf: np.ndarray, used: int, needed: int) -> np.ndarray:
+    """容量不足时按两倍扩容（保留前 used 行），避免每次追加都复制整个数组"""
+    if needed <= len(buf):
+        return buf
+    grown = np.empty((max(2 * len(buf), needed),) + buf.shape[1:], dtype=buf.dtype)
+    np.copyto(grown[:used], buf[:used])
+    return grown
+
+
+def _synchronized(method):
+    """在实例锁内执行方法，避免后台自动保存与写操作并发"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def encode_texts(sentence_model, texts: List[str], batch_size: int = 64,
+                 cache: Optional[EmbeddingCache] = None, **encode_kwargs) -> np.ndarray:
+    """去重并按长度排序后批量编码文本，结果按原顺序返回
+    
+    重复文本只编码一次；长度相近的文本分在同一批，减少补齐(padding)带来的无效计算。
+    提供cache时先查磁盘缓存，只编码未命中的文本并写回缓存
+    """
+    unique = {}
+    inverse = np.fromiter((unique.setdefault(text, len(unique)) for text in texts),
+                          dtype=np.int64, count=len(texts))
+    unique_texts = list(unique)
+    if not unique_texts:
+        return np.empty((0, sentence_model.get_sentence_embedding_dimension()), dtype=np.float32)
+    
+    cached = cache.get_many(unique_texts) if cache is not None else {}
+    missing = [text for text in unique_texts if text not in cached]
+    if missing:
+        order = np.argsort([len(text) for text in missing], kind='stable')
+        embeddings = sentence_model.encode(
+            [missing[i] for i in order],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            **encode_kwargs
+        )
+        # 将排序后的结果还原为未命中文本的顺序
+        encoded = dict(zip((missing[i] for i in order), embeddings))
+        if cache is not None:
+            cache.put_many(encoded)
+        cached.update(encoded)
+    
+    unique_embeddings = np.stack([cached[text] for text in unique_texts]).astype(np.float32, copy=False)
+    return unique_embeddings[inverse]
 
 
 class VectorStore:
     """向量存储和检索系统"""
     
-    def __init__(self, store_dir: str = "data/vectors", embedding_dim: int = 384):
+    # 支持的索引类型：flat为精确搜索，hnsw为近似最近邻图索引，ivf为倒排聚类索引，
+    # fp16/sq8为按半精度/8位标量量化存储的暴力搜索（扫描的数据量降为1/2、1/4）
+    INDEX_TYPES = ("flat", "hnsw", "ivf", "fp16", "sq8")
+    
+    # 标量量化索引类型对应的量化方式
+    SCALAR_QUANTIZER_TYPES = {
+        "fp16": faiss.ScalarQuantizer.QT_fp16,
+        "sq8": faiss.ScalarQuantizer.QT_8bit
+    }
+    
+    # vectors.h5 的分块大小和读取时的分块缓存大小
+    H5_CHUNK_BYTES = 1 << 20
+    H5_CACHE_BYTES = 16 << 20
+    
+    # 8位标量量化训练（统计每维取值范围）所需的最少向量数，不足时先用精确索引
+    SQ_MIN_TRAIN_VECTORS = 1000
+    
+    # IVF训练所需的最少向量数为 nlist 的倍数，不足时先用精确索引
+    IVF_MIN_TRAIN_FACTOR = 30
+    
+    # IVF聚类中心数低于目标值（√N）的该分之一时，在后台重新训练
+    IVF_NLIST_DRIFT_FACTOR = 2
+    
+    # 向量数超过该值时IVF改用乘积量化（PQ）压缩存储
+    IVF_PQ_MIN_VECTORS = 1_000_000
+    
+    # PQ子空间数量（需整除向量维度）及每个子空间的编码位数
+    IVF_PQ_M = 48
+    IVF_PQ_BITS = 8
+    
+    # 精确搜索时每次矩阵乘法处理的查询数
+    BLAS_QUERY_BLOCK = 16
+    
+    # 按ID查找时，尚未并入排序查找表的新增行超过该数量（且超过已排序行数的该分之一）时合并
+    ID_LOOKUP_TAIL_MIN = 1024
+    ID_LOOKUP_TAIL_FRACTION = 8
+    
+    def __init__(self, store_dir: str = "data/vectors", embedding_dim: int = 384,
+                 index_type: str = "flat", hnsw_m: int = 16, hnsw_ef_search: int = 64,
+                 ivf_nlist: Optional[int] = None, ivf_nprobe: Optional[int] = None,
+                 autosave_interval: float = 30.0):
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+        
         self.store_dir = store_dir
         self.embedding_dim = embedding_dim
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        # IVF聚类中心数和搜索时探查的聚类数，未指定时分别取 √N 和 √nlist
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
         
         # 确保存储目录存在
         os.makedirs(store_dir, exist_ok=True)
@@ -29,13 +178,126 @@ class VectorStore:
         self.vectors_file = os.path.join(store_dir, "vectors.h5")
         self.metadata_file = os.path.join(store_dir, "metadata.json")
         
-        # 内存中的数据
-        self.vectors = []
+        # 内存中的数据（向量存放在按几何倍数扩容的预分配缓冲区中，见 vectors 属性）
+        self._vectors_buf = np.empty((0, embedding_dim), dtype=np.float32)
+        self._size = 0
         self.metadata = []
-        self.id_to_index = {}
+        # 与metadata按行对齐的ID哈希列和删除标记列，与向量一样存放在按两倍扩容的缓冲区中，
+        # 前 _num_rows 项有效（见 _id_hashes 和 deleted 属性）；统计和过滤时无需逐条访问字典
+        self._id_hash_buf = np.zeros(0, dtype=np.int64)
+        self._deleted_buf = np.zeros(0, dtype=bool)
+        self._num_rows = 0
+        # 按ID查找用的 (按哈希排序的行号, 排序后的哈希, 已排序的行数)，按ID查找时在连续的int64数组上二分，
+        # 不为每个ID维护Python字典项；之后新增的行在查找时线性扫描，积累到一定数量后再合并
+        self._id_lookup = None
+        
+        # 有未保存的修改时为True，由后台线程定期保存，进程退出时再保存一次
+        self._dirty = False
+        self._lock = threading.RLock()
+        # vectors.h5 中已写入的行数（可追加时），为None时下次保存需要完整重写
+        self._h5_rows = None
+        # 索引中是否仍残留已删除的向量（HNSW不支持remove_ids），为True时搜索需用ID选择器排除
+        self._deleted_in_index = False
+        # 后台重新训练索引的线程；索引被其他操作替换时递增代数，丢弃过时的后台结果
+        self._reindex_thread = None
+        self._index_generation = 0
         
         # 加载已有数据
         self.load_store()
+        
+        if autosave_interval > 0:
+            self._start_autosave(autosave_interval)
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """已存储的向量（缓冲区前 _size 行的视图，不复制数据）"""
+        return self._vectors_buf[:self._size]
+    
+    @vectors.setter
+    def vectors(self, vectors):
+        self._vectors_buf = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.embedding_dim)
+        self._size = len(self._vectors_buf)
+    
+    def _append_vectors(self, vectors: np.ndarray):
+        """追加向量，容量不足时按两倍扩容，避免每次插入都复制整个矩阵"""
+        end = self._size + len(vectors)
+        self._vectors_buf = _grow_buffer(self._vectors_buf, self._size, end)
+        self._vectors_buf[self._size:end] = vectors
+        self._size = end
+    
+    @property
+    def deleted(self) -> np.ndarray:
+        """与metadata按行对齐的删除标记列（缓冲区的视图，可原地修改）"""
+        return self._deleted_buf[:self._num_rows]
+    
+    @property
+    def _id_hashes(self) -> np.ndarray:
+        """与metadata按行对齐的ID哈希列（缓冲区的视图）"""
+        return self._id_hash_buf[:self._num_rows]
+    
+    def _set_row_columns(self, id_hashes: np.ndarray, deleted: np.ndarray):
+        """替换ID哈希列和删除标记列，排序后的查找表在下次查找时重建"""
+        self._id_hash_buf = np.array(id_hashes, dtype=np.int64)
+        self._deleted_buf = np.array(deleted, dtype=bool)
+        self._num_rows = len(self._id_hash_buf)
+        self._id_lookup = None
+    
+    def _append_row_columns(self, id_hashes: np.ndarray):
+        """为新增的行追加ID哈希和删除标记（未删除），容量不足时按两倍扩容"""
+        end = self._num_rows + len(id_hashes)
+        self._id_hash_buf = _grow_buffer(self._id_hash_buf, self._num_rows, end)
+        self._deleted_buf = _grow_buffer(self._deleted_buf, self._num_rows, end)
+        self._id_hash_buf[self._num_rows:end] = id_hashes
+        self._deleted_buf[self._num_rows:end] = False
+        self._num_rows = end
+    
+    def _start_autosave(self, interval: float):
+        """启动后台线程定期保存修改，并在进程退出时保存
+        
+        线程和atexit只持有弱引用，不会阻止向量库被回收
+        """
+        store_ref = weakref.ref(self)
+        stop_event = threading.Event()
+        
+        def flush_store():
+            store = store_ref()
+            if store is not None:
+                store.flush()
+        
+        def autosave_loop():
+            while not stop_event.wait(interval):
+                if store_ref() is None:
+                    return
+                flush_store()
+        
+        threading.Thread(target=autosave_loop, name="vector-store-autosave", daemon=True).start()
+        atexit.register(flush_store)
+        weakref.finalize(self, stop_event.set)
+    
+    def flush(self) -> bool:
+        """有未保存的修改时保存到磁盘"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            return self.save_store()
+    
+    @staticmethod
+    def _h5_compression() -> Dict[str, Any]:
+        """vectors.h5 的压缩参数：安装了hdf5plugin时使用bitshuffle+LZ4（压缩率更高、解压更快），否则使用LZF"""
+        if hdf5plugin is not None:
+            return dict(hdf5plugin.Bitshuffle(cname='lz4'))
+        return {'compression': 'lzf'}
+    
+    def _check_h5_filters(self, dataset):
+        """读取前检查压缩过滤器是否可用，缺少hdf5plugin时给出明确的错误"""
+        if hdf5plugin is not None:
+            return
+        plist = dataset.id.get_create_plist()
+        filter_ids = {plist.get_filter(i)[0] for i in range(plist.get_nfilters())}
+        if H5_BITSHUFFLE_FILTER in filter_ids:
+            raise MissingHDF5PluginError(
+                f"{self.vectors_file} 使用bitshuffle压缩，读取需要安装hdf5plugin: pip install hdf5plugin"
+            )
     
     def load_store(self):
         """加载已保存的向量库"""
@@ -45,59 +307,260 @@ class VectorStore:
                 self.faiss_index = faiss.read_index(self.index_file)
                 print(f"✓ 加载FAISS索引: {self.faiss_index.ntotal} 个向量")
             else:
-                # 创建新的FAISS索引 (使用内积搜索，适合归一化向量)
-                self.faiss_index = faiss.IndexFlatIP(self.embedding_dim)
-                print("✓ 创建新的FAISS索引")
+                self.faiss_index = self._create_index()
+                print(f"✓ 创建新的FAISS索引: {type(self._base_index()).__name__}")
             
             # 加载元数据
             if os.path.exists(self.metadata_file):
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
+                with open(self.metadata_file, 'rb') as f:
+                    self.metadata = orjson.loads(f.read())
                     
-                # 重建ID到索引的映射
-                self.id_to_index = {
-                    item['id']: idx for idx, item in enumerate(self.metadata)
-                }
+                # 重建ID哈希列和删除标记列
+                self._set_row_columns(
+                    np.fromiter((_id_hash(item['id']) for item in self.metadata),
+                                dtype=np.int64, count=len(self.metadata)),
+                    np.fromiter((item.get('deleted', False) for item in self.metadata),
+                                dtype=bool, count=len(self.metadata))
+                )
                 print(f"✓ 加载元数据: {len(self.metadata)} 条记录")
             
             # 加载向量数据到内存（用于快速访问）
             if os.path.exists(self.vectors_file):
-                with h5py.File(self.vectors_file, 'r') as f:
+                with h5py.File(self.vectors_file, 'r', rdcc_nbytes=self.H5_CACHE_BYTES) as f:
                     if 'vectors' in f:
-                        self.vectors = f['vectors'][:]
+                        # 直接读入预分配的float32数组（旧版本保存的半精度文件由HDF5转换），避免中间副本
+                        dataset = f['vectors']
+                        self._check_h5_filters(dataset)
+                        vectors = np.empty(dataset.shape, dtype=np.float32)
+                        if dataset.size:
+                            dataset.read_direct(vectors)
+                        self.vectors = vectors
+                        # 旧版本的半精度文件不在其后追加，下次保存时整体重写为float32
+                        if dataset.maxshape[0] is None and dataset.dtype == np.float32:
+                            self._h5_rows = len(vectors)
                         print(f"✓ 加载向量数据: {self.vectors.shape}")
+            
+            # 向量行号即元数据行号和索引中的ID；保存中途退出等原因导致行数不一致时，
+            # 行号已无法对应，丢弃已保存的数据，由调用方重新构建
+            if len(self.vectors) != len(self.metadata):
+                print(f"向量数({len(self.vectors)})与元数据数({len(self.metadata)})不一致，重置向量库")
+                self._initialize_empty_store()
+                return
+            
+            # 已保存的索引类型与配置不一致时，用已有向量重建索引
+            if not self._index_matches_config(self.faiss_index):
+                self._reindex_vectors()
+            elif self._uses_blas_search() and self.faiss_index.ntotal > 0:
+                # 旧版本保存的精确索引中带有向量副本，释放它们
+                self.faiss_index.reset()
+            else:
+                # 无法确认已删除的向量是否都已从索引中移除，保守地在搜索时排除
+                self._deleted_in_index = bool(self.deleted.any())
                         
+        except MissingHDF5PluginError:
+            # 不能以空库继续运行，否则下次保存会用空数据覆盖已有的向量文件
+            raise
         except Exception as e:
             print(f"加载向量库时出错: {e}")
             self._initialize_empty_store()
     
+    def _ivf_nlist(self, num_rows: Optional[int] = None) -> int:
+        """IVF聚类中心数，默认取向量数（未指定时为当前向量数）的平方根"""
+        num_rows = len(self.vectors) if num_rows is None else num_rows
+        return self.ivf_nlist or max(1, int(np.sqrt(num_rows)))
+    
+    def _index_class(self, num_rows: Optional[int] = None):
+        """当前配置和向量数（未指定时为当前向量数）下应使用的FAISS索引类"""
+        num_rows = len(self.vectors) if num_rows is None else num_rows
+        if self.index_type == "hnsw":
+            return faiss.IndexHNSWFlat
+        if self.index_type == "ivf" and num_rows >= self.IVF_MIN_TRAIN_FACTOR * self._ivf_nlist(num_rows):
+            if num_rows > self.IVF_PQ_MIN_VECTORS and self.embedding_dim % self.IVF_PQ_M == 0:
+                return faiss.IndexIVFPQ
+            return faiss.IndexIVFFlat
+        if self.index_type == "fp16" or (self.index_type == "sq8" and num_rows >= self.SQ_MIN_TRAIN_VECTORS):
+            return faiss.IndexScalarQuantizer
+        return faiss.IndexFlatIP
+    
+    def _base_index(self):
+        """IndexIDMap2 包装下的实际索引"""
+        return faiss.downcast_index(self.faiss_index.index)
+    
+    def _index_matches_config(self, index) -> bool:
+        """索引是否为 IndexIDMap2 包装，且内部索引的类型（及标量量化方式）与当前配置一致"""
+        if not isinstance(index, faiss.IndexIDMap2):
+            return False
+        base = faiss.downcast_index(index.index)
+        if type(base) is not self._index_class():
+            return False
+        if isinstance(base, faiss.IndexScalarQuantizer):
+            return base.sq.qtype == self.SCALAR_QUANTIZER_TYPES[self.index_type]
+        if isinstance(base, faiss.IndexIVF) and self.ivf_nlist is None:
+            # 向量数增长后聚类中心数远低于 √N 时，每个聚类过大，召回和速度都会偏离预期
+            return base.nlist * self.IVF_NLIST_DRIFT_FACTOR >= self._ivf_nlist()
+        return True
+    
+    def _create_index(self, vectors: np.ndarray = None):
+        """按配置创建FAISS索引，外层用 IndexIDMap2 包装，向量的ID即其在metadata中的行号，
+        删除时可直接从索引中移除；vectors为训练用的向量，默认为当前全部向量
+        """
+        return faiss.IndexIDMap2(self._create_base_index(self.vectors if vectors is None else vectors))
+    
+    def _create_base_index(self, vectors: np.ndarray):
+        """按配置的索引类型创建FAISS索引（使用内积搜索，适合归一化向量）
+        
+        IVF索引和8位标量量化需要先用已有向量训练；向量不足以训练时使用精确索引，
+        之后 add_vectors 中向量数达到要求时在后台切换。索引类和聚类中心数按训练向量的行数确定，
+        后台训练时与快照一致，而不是训练期间仍在增长的当前向量数
+        """
+        num_rows = len(vectors)
+        index_class = self._index_class(num_rows)
+        if index_class is faiss.IndexHNSWFlat:
+            index = faiss.IndexHNSWFlat(self.embedding_dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            index.hnsw.efSearch = self.hnsw_ef_search
+            return index
+        if index_class is faiss.IndexFlatIP:
+            return faiss.IndexFlatIP(self.embedding_dim)
+        if index_class is faiss.IndexScalarQuantizer:
+            index = faiss.IndexScalarQuantizer(self.embedding_dim, self.SCALAR_QUANTIZER_TYPES[self.index_type],
+                                               faiss.METRIC_INNER_PRODUCT)
+            if not index.is_trained:
+                index.train(np.asarray(vectors, dtype=np.float32))
+            return index
+        
+        # IVF必须显式指定内积度量，否则默认为L2距离
+        nlist = self._ivf_nlist(num_rows)
+        quantizer = faiss.IndexFlatIP(self.embedding_dim)
+        if index_class is faiss.IndexIVFPQ:
+            index = faiss.IndexIVFPQ(quantizer, self.embedding_dim, nlist, self.IVF_PQ_M, self.IVF_PQ_BITS,
+                                     faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, self.embedding_dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(np.asarray(vectors, dtype=np.float32))
+        return index
+    
+    def _reindex_vectors(self):
+        """用内存中的向量重新创建FAISS索引"""
+        self._index_generation += 1
+        self.faiss_index = self._create_index()
+        self._add_active_vectors()
+        print(f"✓ 索引类型切换为 {type(self._base_index()).__name__}: {self.faiss_index.ntotal} 个向量")
+    
+    def _add_active_vectors(self):
+        """将未删除的向量以行号为ID加入刚创建的索引"""
+        self._deleted_in_index = False
+        if self._uses_blas_search():
+            return
+        ids = np.arange(len(self.vectors), dtype=np.int64)
+        if len(self.deleted) == len(ids):
+            ids = ids[~self.deleted]
+        if len(ids) > 0:
+            self.faiss_index.add_with_ids(self.vectors[ids], ids)
+    
+    def _schedule_reindex(self):
+        """启动后台线程重新训练索引（已有线程在运行时不重复启动）"""
+        if self._reindex_thread is not None and self._reindex_thread.is_alive():
+            return
+        self._reindex_thread = threading.Thread(target=self._reindex_in_background,
+                                                name="vector-store-reindex", daemon=True)
+        self._reindex_thread.start()
+    
+    def _reindex_in_background(self):
+        """在锁外用向量快照训练新索引，再在锁内补上训练期间的增删并替换当前索引
+        
+        向量行只会追加不会原地修改，持有的快照视图在训练期间保持不变
+        """
+        try:
+            with self._lock:
+                generation = self._index_generation
+                num_rows = len(self.vectors)
+                vectors = self.vectors
+                deleted = self.deleted[:num_rows].copy()
+            
+            index = self._create_index(vectors)
+            stores_vectors = not self._uses_blas_search(index)
+            active = np.flatnonzero(~deleted)
+            if stores_vectors and len(active) > 0:
+                index.add_with_ids(vectors[active], active.astype(np.int64))
+            
+            with self._lock:
+                if generation != self._index_generation:
+                    return
+                self._index_generation += 1
+                self.faiss_index = index
+                self._deleted_in_index = False
+                # 训练期间新增的行
+                new_rows = np.arange(num_rows, len(self.vectors), dtype=np.int64)
+                new_rows = new_rows[~self.deleted[num_rows:]]
+                if stores_vectors and len(new_rows) > 0:
+                    index.add_with_ids(self.vectors[new_rows], new_rows)
+                # 训练期间删除或取消删除的行
+                for row in np.flatnonzero(self.deleted[:num_rows] != deleted).tolist():
+                    if self.deleted[row]:
+                        self._remove_from_index(row)
+                    else:
+                        self._restore_to_index(row)
+                self._dirty = True
+                print(f"✓ 索引类型切换为 {type(self._base_index()).__name__}: {self.faiss_index.ntotal} 个向量")
+        except Exception as e:
+            print(f"后台重建索引失败，继续使用当前索引: {e}")
+    
     def _initialize_empty_store(self):
         """初始化空的向量库"""
-        self.faiss_index = faiss.IndexFlatIP(self.embedding_dim)
         self.vectors = []
         self.metadata = []
-        self.id_to_index = {}
+        self._set_row_columns(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool))
+        self._h5_rows = None
+        self._deleted_in_index = False
+        self._index_generation += 1
+        self.faiss_index = self._create_index()
+        # 磁盘上可能还有旧数据，下次保存时覆盖
+        self._dirty = True
         print("✓ 初始化空向量库")
     
-    def add_vectors(self, vectors: np.ndarray, metadata_list: List[Dict]) -> List[int]:
-        """添加向量到存储库"""
+    def _normalized_copy(self, vectors: np.ndarray) -> np.ndarray:
+        """复制为C连续的float32矩阵后用FAISS的SIMD内核原地做L2归一化（零向量保持为零）"""
+        normalized = np.array(vectors, dtype=np.float32, order='C').reshape(-1, self.embedding_dim)
+        faiss.normalize_L2(normalized)
+        return normalized
+    
+    def _as_f32_rowmajor(self, vectors: np.ndarray) -> np.ndarray:
+        """已是C连续float32矩阵时原样返回，否则转换一次；一维向量以视图方式变为单行矩阵"""
+        if isinstance(vectors, np.ndarray) and vectors.dtype == np.float32 and vectors.flags['C_CONTIGUOUS']:
+            return vectors.reshape(-1, self.embedding_dim)
+        return np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.embedding_dim)
+    
+    def _prepare_vectors(self, vectors: np.ndarray, normalized: bool) -> np.ndarray:
+        """调用方保证已L2归一化时不再复制和归一化（不会修改传入的数组）"""
+        if normalized:
+            return self._as_f32_rowmajor(vectors)
+        return self._normalized_copy(vectors)
+    
+    @_synchronized
+    def add_vectors(self, vectors: np.ndarray, metadata_list: List[Dict], normalized: bool = False) -> List[int]:
+        """添加向量到存储库（normalized=True 表示向量已L2归一化）"""
         if len(vectors) != len(metadata_list):
             raise ValueError("向量数量与元数据数量不匹配")
         
-        # 归一化向量（用于余弦相似度）
-        vectors_normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        # 归一化向量（用于余弦相似度），保持C连续的float32以便BLAS直接计算
+        vectors_normalized = self._prepare_vectors(vectors, normalized)
         
-        # 添加到FAISS索引
-        self.faiss_index.add(vectors_normalized.astype(np.float32))
+        # 添加到FAISS索引，ID为新向量的行号（精确索引由BLAS直接搜索向量矩阵，无需加入）
+        start_index = len(self.metadata)
+        if not self._uses_blas_search():
+            ids = np.arange(start_index, start_index + len(vectors_normalized), dtype=np.int64)
+            self.faiss_index.add_with_ids(vectors_normalized, ids)
         
         # 更新内存数据
-        if len(self.vectors) == 0:
-            self.vectors = vectors_normalized
-        else:
-            self.vectors = np.vstack([self.vectors, vectors_normalized])
+        self._append_vectors(vectors_normalized)
+        
+        # 向量数已足够训练IVF/8位量化（或需要切换到PQ、聚类中心数需要增加）时，在后台重建索引；
+        # 训练可能耗时很久，不在调用方（可能是事件循环）中同步进行，重建完成前继续使用当前索引
+        if not self._index_matches_config(self.faiss_index):
+            self._schedule_reindex()
         
         # 添加元数据
-        start_index = len(self.metadata)
         indices = []
         
         for i, meta in enumerate(metadata_list):
@@ -106,48 +569,208 @@ class VectorStore:
             meta['created_at'] = datetime.now().isoformat()
             
             self.metadata.append(meta)
-            self.id_to_index[meta['id']] = index
             indices.append(index)
+        self._append_row_columns(
+            np.fromiter((_id_hash(meta['id']) for meta in metadata_list), dtype=np.int64, count=len(metadata_list))
+        )
+        self._dirty = True
         
         print(f"✓ 添加 {len(vectors)} 个向量到存储库")
         return indices
     
     def search_similar(self, query_vector: np.ndarray, top_k: int = 10, 
-                      threshold: float = 0.0) -> List[Tuple[Dict, float]]:
-        """搜索相似向量"""
-        if self.faiss_index.ntotal == 0:
+                      threshold: float = 0.0, normalized: bool = False) -> List[Tuple[Dict, float]]:
+        """搜索相似向量（已删除的向量不会出现在结果中，normalized=True 表示查询向量已L2归一化）"""
+        num_searchable = self._num_searchable()
+        if num_searchable == 0:
             return []
         
         # 归一化查询向量
-        query_normalized = query_vector / np.linalg.norm(query_vector)
-        query_normalized = query_normalized.reshape(1, -1).astype(np.float32)
+        query_normalized = self._prepare_vectors(query_vector, normalized)
+        
+        search_k = min(top_k, num_searchable)
+        
+        if self._uses_blas_search():
+            # FAISS只在查询之间并行，单个查询是单线程扫描；
+            # 改用BLAS矩阵向量乘法，由多线程BLAS在数据库行上并行
+            scores, indices = self._blas_search(query_normalized, search_k)
+        else:
+            scores, indices = self._search_index(query_normalized, search_k)
+        return self._collect_results(scores[0], indices[0], top_k, threshold)
+    
+    def search_similar_batch(self, query_vectors: np.ndarray, top_k: int = 10,
+                             threshold: float = 0.0, normalized: bool = False) -> List[List[Tuple[Dict, float]]]:
+        """批量搜索相似向量：精确索引用一次矩阵乘法计算整批查询，其他索引一次提交给FAISS，由FAISS在查询之间并行"""
+        num_searchable = self._num_searchable()
+        if num_searchable == 0:
+            return [[] for _ in query_vectors]
         
-        # 使用FAISS搜索
-        scores, indices = self.faiss_index.search(query_normalized, min(top_k * 2, self.faiss_index.ntotal))
+        query_matrix = self._prepare_vectors(query_vectors, normalized)
         
-        # 过滤结果并组装返回数据
+        search_k = min(top_k, num_searchable)
+        if self._uses_blas_search():
+            scores, indices = self._blas_search(query_matrix, search_k)
+        else:
+            scores, indices = self._search_index(query_matrix, search_k)
+        return [
+            self._collect_results(query_scores, query_indices, top_k, threshold)
+            for query_scores, query_indices in zip(scores, indices)
+        ]
+    
+    def _uses_blas_search(self, index=None) -> bool:
+        """精确内积索引的搜索直接用内存中的向量矩阵（BLAS）完成
+        
+        这种情况下FAISS索引只是空壳，不再保存向量，同一份向量不会在内存中存两份
+        """
+        index = self.faiss_index if index is None else index
+        return isinstance(faiss.downcast_index(index.index), faiss.IndexFlatIP)
+    
+    def _num_searchable(self) -> int:
+        """可被搜索到的向量数"""
+        if self._uses_blas_search():
+            num_rows = len(self.vectors)
+            return num_rows - int(np.count_nonzero(self.deleted[:num_rows]))
+        return self.faiss_index.ntotal
+    
+    def _blas_search(self, query_matrix: np.ndarray, search_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """用BLAS矩阵乘法一次计算一组查询与所有向量的内积，返回与FAISS search相同形状的结果
+        
+        存储的向量和查询都已归一化，内积即余弦相似度；已删除的行置为-inf。
+        查询按块处理，限制分数矩阵的内存占用
+        """
+        # 先取局部引用：并发的 add_vectors 可能已追加向量但尚未追加删除标记和元数据，
+        # 只计算已有元数据的行
+        num_rows = min(len(self.vectors), len(self.metadata))
+        vectors = self.vectors[:num_rows]
+        deleted = self.deleted[:num_rows]
+        search_k = min(search_k, num_rows)
+        all_scores = np.empty((len(query_matrix), search_k), dtype=np.float32)
+        all_indices = np.empty((len(query_matrix), search_k), dtype=np.int64)
+        if search_k == 0:
+            return all_scores, all_indices
+        for start in range(0, len(query_matrix), self.BLAS_QUERY_BLOCK):
+            end = start + self.BLAS_QUERY_BLOCK
+            scores = query_matrix[start:end] @ vectors.T
+            scores[:, :len(deleted)][:, deleted] = -np.inf
+            indices = np.argpartition(-scores, search_k - 1, axis=1)[:, :search_k]
+            top_scores = np.take_along_axis(scores, indices, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            all_scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+            all_indices[start:end] = np.take_along_axis(indices, order, axis=1)
+        return all_scores, all_indices
+    
+    def _search_index(self, query_matrix: np.ndarray, search_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """使用FAISS索引搜索，按索引类型设置搜索参数
+        
+        存在已删除的向量时，通过ID选择器让FAISS在搜索内核中直接跳过它们，无需多取结果再过滤
+        """
+        # 搜索宽度不能小于返回数量，否则召回不足
+        ef_search = max(self.hnsw_ef_search, search_k)
+        base = self._base_index()
+        nprobe = None
+        if isinstance(base, faiss.IndexIVF):
+            nprobe = self.ivf_nprobe or max(1, int(np.sqrt(base.nlist)))
+        
+        # 已删除的向量通常已通过remove_ids移出索引，仅在无法移除时（HNSW）才需要选择器
+        if not self._deleted_in_index:
+            if self.index_type == "hnsw":
+                base.hnsw.efSearch = ef_search
+            elif nprobe is not None:
+                base.nprobe = nprobe
+            return self.faiss_index.search(query_matrix, search_k)
+        
+        # 选择器作用于外部ID（即行号）；位图按小端位序存放：第i行对应 bitmap[i >> 3] 的第 (i & 7) 位
+        deleted = self.deleted
+        bitmap = np.packbits(deleted, bitorder='little')
+        # IDSelectorBitmap 的长度参数是位图的字节数，而不是位数
+        deleted_selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        selector = faiss.IDSelectorNot(deleted_selector)
+        if self.index_type == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=ef_search)
+        elif nprobe is not None:
+            params = faiss.SearchParametersIVF(nprobe=nprobe)
+        else:
+            params = faiss.SearchParameters()
+        params.sel = selector
+        
+        # FAISS只持有bitmap和选择器的裸指针，局部变量在搜索结束前保持它们的引用
+        return self.faiss_index.search(query_matrix, search_k, params=params)
+    
+    def _collect_results(self, scores: np.ndarray, indices: np.ndarray, top_k: int,
+                         threshold: float) -> List[Tuple[Dict, float]]:
+        """过滤结果并组装返回数据
+        
+        FAISS和BLAS路径返回的scores都已按从高到低排列，无需再排序；遇到低于阈值的分数即可停止
+        """
+        metadata = self.metadata
         results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx >= 0 and score >= threshold:  # FAISS可能返回-1表示无效索引
-                if idx < len(self.metadata):
-                    results.append((self.metadata[idx], float(score)))
+        for score, idx in zip(scores.tolist(), indices.tolist()):
+            if score < threshold or len(results) >= top_k:
+                break
+            # FAISS可能返回-1表示无效索引；并发的 add_vectors 可能已将向量加入索引但尚未追加元数据
+            if 0 <= idx < len(metadata):
+                results.append((metadata[idx], score))
+        return results
+    
+    def _id_lookup_table(self, id_hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+        """返回按ID查找用的排序表，未排序的新增行过多时将其归并进去
         
-        # 按分数排序并返回top_k
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:top_k]
+        已有排序表时只对新增行排序后插入（O(N)），不重新对全部行排序
+        """
+        lookup = self._id_lookup
+        num_rows = len(id_hashes)
+        if lookup is not None:
+            order, sorted_hashes, sorted_rows = lookup
+            tail = num_rows - sorted_rows
+            if tail <= max(self.ID_LOOKUP_TAIL_MIN, sorted_rows // self.ID_LOOKUP_TAIL_FRACTION):
+                return lookup
+            new_order = np.argsort(id_hashes[sorted_rows:], kind='stable')
+            new_hashes = id_hashes[sorted_rows:][new_order]
+            # side='right' 使相同哈希的新行排在旧行之后，与整体稳定排序的结果一致
+            positions = np.searchsorted(sorted_hashes, new_hashes, side='right')
+            order = np.insert(order, positions, new_order + sorted_rows)
+            sorted_hashes = np.insert(sorted_hashes, positions, new_hashes)
+        else:
+            order = np.argsort(id_hashes, kind='stable')
+            sorted_hashes = id_hashes[order]
+        self._id_lookup = lookup = (order, sorted_hashes, num_rows)
+        return lookup
+    
+    def _find_index(self, vector_id: str) -> Optional[int]:
+        """按ID查找行号：在排序后的哈希数组上二分查找（尚未排序的新增行线性扫描），再核对metadata中的ID以排除哈希碰撞
+        
+        同一ID出现多次时返回最后添加的一行
+        """
+        id_hashes = self._id_hashes
+        order, sorted_hashes, sorted_rows = self._id_lookup_table(id_hashes)
+        id_hash = _id_hash(vector_id)
+        
+        # 新增行在排序表中的行之后，先从后往前查找
+        for pos in np.flatnonzero(id_hashes[sorted_rows:] == id_hash)[::-1].tolist():
+            index = sorted_rows + pos
+            if self.metadata[index]['id'] == vector_id:
+                return index
+        
+        start = np.searchsorted(sorted_hashes, id_hash, side='left')
+        end = np.searchsorted(sorted_hashes, id_hash, side='right')
+        for pos in range(end - 1, start - 1, -1):
+            index = int(order[pos])
+            if self.metadata[index]['id'] == vector_id:
+                return index
+        return None
     
     def get_vector_by_id(self, vector_id: str) -> Optional[Tuple[np.ndarray, Dict]]:
         """根据ID获取向量和元数据"""
-        if vector_id in self.id_to_index:
-            index = self.id_to_index[vector_id]
-            if index < len(self.vectors):
-                return self.vectors[index], self.metadata[index]
+        index = self._find_index(vector_id)
+        if index is not None and index < len(self.vectors):
+            return self.vectors[index], self.metadata[index]
         return None
     
+    @_synchronized
     def update_metadata(self, vector_id: str, new_metadata: Dict) -> bool:
         """更新向量的元数据"""
-        if vector_id in self.id_to_index:
-            index = self.id_to_index[vector_id]
+        index = self._find_index(vector_id)
+        if index is not None:
             if index < len(self.metadata):
                 # 保留一些系统字段
                 new_metadata['id'] = vector_id
@@ -155,33 +778,80 @@ class VectorStore:
                 new_metadata['updated_at'] = datetime.now().isoformat()
                 
                 self.metadata[index] = new_metadata
+                was_deleted = bool(self.deleted[index])
+                is_deleted = bool(new_metadata.get('deleted', False))
+                self.deleted[index] = is_deleted
+                # 删除标记变化时同步FAISS索引，与 delete_vector 走相同的路径
+                if is_deleted and not was_deleted:
+                    self._remove_from_index(index)
+                elif was_deleted and not is_deleted:
+                    self._restore_to_index(index)
+                self._dirty = True
                 return True
         return False
     
+    @_synchronized
     def delete_vector(self, vector_id: str) -> bool:
-        """删除向量（标记为删除，不实际删除以保持索引一致性）"""
-        if vector_id in self.id_to_index:
-            index = self.id_to_index[vector_id]
+        """删除向量：从FAISS索引中移除，元数据和向量行保留标记，由 rebuild_index 压缩"""
+        index = self._find_index(vector_id)
+        if index is not None:
             if index < len(self.metadata):
                 self.metadata[index]['deleted'] = True
                 self.metadata[index]['deleted_at'] = datetime.now().isoformat()
+                self.deleted[index] = True
+                self._remove_from_index(index)
+                self._dirty = True
                 return True
         return False
     
+    def _remove_from_index(self, index: int):
+        """从FAISS索引中移除一行，搜索时不再扫描它；HNSW图不支持移除，改为搜索时用选择器排除"""
+        if self._uses_blas_search():
+            # 精确索引不保存向量，BLAS搜索按删除标记排除
+            return
+        if self.index_type != "hnsw":
+            try:
+                if self.faiss_index.remove_ids(np.array([index], dtype=np.int64)) == 1:
+                    return
+            except RuntimeError as e:
+                print(f"从索引中移除向量失败，改为搜索时排除: {e}")
+        self._deleted_in_index = True
+    
+    def _restore_to_index(self, index: int):
+        """取消删除后将该行重新加入FAISS索引
+        
+        HNSW从未真正移除，清除删除标记后选择器即不再排除它；其他索引先按ID移除（不存在时为空操作）
+        再加入，避免移除失败时残留的旧条目与新条目重复
+        """
+        if self.index_type == "hnsw" or self._uses_blas_search():
+            return
+        ids = np.array([index], dtype=np.int64)
+        try:
+            self.faiss_index.remove_ids(ids)
+        except RuntimeError:
+            # 无法移除说明该行仍留在索引中，由选择器按删除标记过滤即可
+            return
+        self.faiss_index.add_with_ids(self.vectors[index:index + 1], ids)
+    
+    @_synchronized
     def save_store(self):
         """保存向量库到磁盘"""
         try:
             # 保存FAISS索引
             faiss.write_index(self.faiss_index, self.index_file)
             
-            # 保存元数据
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+            # 保存元数据（非人工编辑的文件，不缩进）
+            with open(self.metadata_file, 'wb') as f:
+                f.write(orjson.dumps(self.metadata))
             
-            # 保存向量数据
+            # 保存向量数据：文件中已有的行保持不变时只追加新增的行；向量库为空时删除旧的向量文件
             if len(self.vectors) > 0:
-                with h5py.File(self.vectors_file, 'w') as f:
-                    f.create_dataset('vectors', data=self.vectors)
+                self._save_vectors()
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.vectors_file)
+                self._h5_rows = None
+            self._dirty = False
             
             print(f"✓ 向量库已保存: {len(self.metadata)} 条记录")
             return True
@@ -190,16 +860,43 @@ class VectorStore:
             print(f"保存向量库失败: {e}")
             return False
     
+    def _save_vectors(self):
+        """将向量写入vectors.h5，可追加时只写入上次保存之后新增的行
+        
+        磁盘上始终保存float32原始向量，量化只发生在索引内部，切换回精确索引时不损失精度
+        """
+        dtype = np.float32
+        num_rows = len(self.vectors)
+        saved_rows = self._h5_rows
+        
+        if saved_rows is not None and saved_rows <= num_rows and os.path.exists(self.vectors_file):
+            with h5py.File(self.vectors_file, 'a') as f:
+                dataset = f['vectors']
+                if dataset.shape[0] == saved_rows:
+                    dataset.resize((num_rows, self.embedding_dim))
+                    dataset[saved_rows:] = self.vectors[saved_rows:].astype(dtype, copy=False)
+                    self._h5_rows = num_rows
+                    return
+        
+        # 每个分块约1 MiB且由整行组成，与按行顺序的读写方式一致；行数不设上限以便之后追加
+        chunk_rows = max(1, self.H5_CHUNK_BYTES // (self.embedding_dim * np.dtype(dtype).itemsize))
+        with h5py.File(self.vectors_file, 'w') as f:
+            f.create_dataset('vectors', data=self.vectors.astype(dtype, copy=False),
+                             maxshape=(None, self.embedding_dim),
+                             chunks=(chunk_rows, self.embedding_dim),
+                             **self._h5_compression())
+        self._h5_rows = num_rows
+    
     def get_stats(self) -> Dict:
         """获取向量库统计信息"""
-        active_count = sum(1 for meta in self.metadata if not meta.get('deleted', False))
+        active_count = len(self.deleted) - int(np.count_nonzero(self.deleted))
         
         return {
             'total_vectors': len(self.metadata),
             'active_vectors': active_count,
             'deleted_vectors': len(self.metadata) - active_count,
             'embedding_dimension': self.embedding_dim,
-            'index_type': type(self.faiss_index).__name__,
+            'index_type': type(self._base_index()).__name__,
             'store_size_mb': self._get_store_size()
         }
     
@@ -211,35 +908,30 @@ class VectorStore:
                 total_size += os.path.getsize(file_path)
         return round(total_size / (1024 * 1024), 2)
     
+    @_synchronized
     def rebuild_index(self):
         """重建索引（清理已删除的向量）"""
         print("开始重建向量索引...")
         
-        # 收集未删除的向量和元数据
-        active_vectors = []
-        active_metadata = []
-        new_id_to_index = {}
+        # 用删除标记列一次性筛选未删除的行，向量通过布尔掩码整体拷贝
+        active = ~self.deleted
+        active_rows = np.flatnonzero(active).tolist()
         
-        for i, meta in enumerate(self.metadata):
-            if not meta.get('deleted', False):
-                active_vectors.append(self.vectors[i])
-                
-                # 更新索引
-                new_index = len(active_metadata)
-                meta['index'] = new_index
-                active_metadata.append(meta)
-                new_id_to_index[meta['id']] = new_index
-        
-        if active_vectors:
-            # 重建FAISS索引
-            self.faiss_index = faiss.IndexFlatIP(self.embedding_dim)
-            active_vectors_array = np.array(active_vectors)
-            self.faiss_index.add(active_vectors_array.astype(np.float32))
-            
+        if active_rows:
             # 更新内存数据
-            self.vectors = active_vectors_array
+            active_metadata = [self.metadata[i] for i in active_rows]
+            for new_index, meta in enumerate(active_metadata):
+                meta['index'] = new_index
+            self.vectors = self.vectors[active]
             self.metadata = active_metadata
-            self.id_to_index = new_id_to_index
+            self._set_row_columns(self._id_hashes[active], np.zeros(len(active_metadata), dtype=bool))
+            self._h5_rows = None
+            self._dirty = True
+            
+            # 重建FAISS索引（IVF按活跃向量数重新确定聚类中心数并重新训练）
+            self._index_generation += 1
+            self.faiss_index = self._create_index()
+            self._add_active_vectors()
             
             print(f"✓ 索引重建完成: {len(active_metadata)} 个活跃向量")
         else:
@@ -250,20 +942,27 @@ class VectorStore:
 class EnhancedSimilarityCalculator:
     """增强的相似度计算器，集成向量库"""
     
-    def __init__(self, method: str = "tfidf", store_dir: str = "data/vectors"):
+    def __init__(self, method: str = "tfidf", store_dir: str = "data/vectors",
+                 index_type: str = "flat"):
         self.method = method
         self.vector_store = None
         self.sentence_model = None
         self.vectorizer = None
+        # 文本向量的磁盘缓存（语义模型加载成功后创建）
+        self.embedding_cache = None
         
         # 初始化模型
         if method == "sentence_transformer":
             try:
-                self.sentence_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+                self.sentence_model = load_sentence_model()
                 # 获取模型的嵌入维度
                 embedding_dim = self.sentence_model.get_sentence_embedding_dimension()
-                self.vector_store = VectorStore(store_dir, embedding_dim)
+                self.vector_store = VectorStore(store_dir, embedding_dim, index_type)
+                self.embedding_cache = EmbeddingCache(os.path.join(store_dir, "embedding_cache.sqlite3"),
+                                                      SENTENCE_MODEL_NAME)
                 print(f"✓ 语义模型加载成功，嵌入维度: {embedding_dim}")
+            except MissingHDF5PluginError:
+                raise
             except Exception as e:
                 print(f"加载语义模型失败: {e}")
                 print("回退到TF-IDF方法")
@@ -280,6 +979,11 @@ class EnhancedSimilarityCalculator:
         """中文分词"""
         return list(jieba.cut(text))
     
+    def _encode(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        """编码为L2归一化的向量，经过磁盘缓存"""
+        return encode_texts(self.sentence_model, texts, cache=self.embedding_cache,
+                            normalize_embeddings=True, show_progress_bar=show_progress_bar)
+    
     def build_vector_index(self, descriptions: List[Dict]) -> bool:
         """构建向量索引"""
         if self.method != "sentence_transformer" or not self.sentence_model:
@@ -294,7 +998,7 @@ class EnhancedSimilarityCalculator:
         
         # 提取文本并生成向量
         texts = [desc["text"] for desc in descriptions]
-        vectors = self.sentence_model.encode(texts, show_progress_bar=True)
+        vectors = self._encode(texts, show_progress_bar=True)
         
         # 准备元数据
         metadata_list = []
@@ -307,7 +1011,7 @@ class EnhancedSimilarityCalculator:
             })
         
         # 添加到向量库
-        indices = self.vector_store.add_vectors(vectors, metadata_list)
+        indices = self.vector_store.add_vectors(vectors, metadata_list, normalized=True)
         
         # 保存到磁盘
         self.vector_store.save_store()
@@ -316,46 +1020,58 @@ class EnhancedSimilarityCalculator:
         return True
     
     def search_similar_vectors(self, query: str, top_k: int = 10, 
-                             threshold: float = 0.1) -> List[Tuple[Dict, float]]:
-        """使用向量库搜索相似内容"""
+                             threshold: float = 0.1, query_vector: np.ndarray = None) -> List[Tuple[Dict, float]]:
+        """使用向量库搜索相似内容（调用方已编码查询时通过query_vector传入归一化向量）"""
         if self.method != "sentence_transformer" or not self.sentence_model:
             return []
         
         # 生成查询向量
-        query_vector = self.sentence_model.encode([query])[0]
+        if query_vector is None:
+            query_vector = self._encode([query])
         
-        # 在向量库中搜索
-        results = self.vector_store.search_similar(
-            query_vector, top_k=top_k, threshold=threshold
+        # 在向量库中搜索（已删除的项目由向量库在搜索时排除）
+        return self.vector_store.search_similar(
+            query_vector, top_k=top_k, threshold=threshold, normalized=True
         )
+    
+    def search_similar_vectors_batch(self, queries: List[str], top_k: int = 10, threshold: float = 0.1,
+                                     query_vectors: np.ndarray = None) -> List[List[Tuple[Dict, float]]]:
+        """批量使用向量库搜索，所有查询一次编码、一次检索"""
+        if self.method != "sentence_transformer" or not self.sentence_model:
+            return [[] for _ in queries]
         
-        # 过滤已删除的项目
-        filtered_results = [
-            (meta, score) for meta, score in results 
-            if not meta.get('deleted', False)
-        ]
-        
-        return filtered_results
+        if query_vectors is None:
+            query_vectors = self._encode(queries)
+        return self.vector_store.search_similar_batch(query_vectors, top_k=top_k, threshold=threshold,
+                                                      normalized=True)
     
     def add_description_to_index(self, description: Dict) -> bool:
         """添加新描述到向量索引"""
+        return self.add_descriptions_to_index([description])
+    
+    def add_descriptions_to_index(self, descriptions: List[Dict]) -> bool:
+        """批量添加描述到向量索引：一次批量编码、一次写入向量库并只保存一次"""
         if self.method != "sentence_transformer" or not self.sentence_model:
             return False
+        if not descriptions:
+            return True
         
         # 生成向量
-        vector = self.sentence_model.encode([description["text"]])[0:1]
+        vectors = self._encode([desc["text"] for desc in descriptions])
         
         # 准备元数据
-        metadata = {
-            'id': description['id'],
-            'text': description['text'],
-            'keywords': description.get('keywords', []),
-            'type': 'description'
-        }
+        metadata_list = [
+            {
+                'id': desc['id'],
+                'text': desc['text'],
+                'keywords': desc.get('keywords', []),
+                'type': 'description'
+            }
+            for desc in descriptions
+        ]
         
-        # 添加到向量库
-        self.vector_store.add_vectors(vector, [metadata])
-        self.vector_store.save_store()
+        # 添加到向量库（由向量库的后台线程定期保存，不必每次添加都重写整个向量库）
+        self.vector_store.add_vectors(vectors, metadata_list, normalized=True)
         
         return True
     
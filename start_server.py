@@ -55,10 +55,15 @@ def main():
     # 启动参数
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
+    workers = int(os.getenv("WORKERS", 1))
+    # 热重载只适合开发环境，且与多进程互斥
+    reload = os.getenv("RELOAD", "false").lower() == "true" and workers == 1
     
     print(f"\n启动配置:")
     print(f"- 主机: {host}")
     print(f"- 端口: {port}")
+    print(f"- 工作进程: {workers}")
+    print(f"- 热重载: {'开启' if reload else '关闭'}")
     print(f"- API文档: http://localhost:{port}/docs")
     print(f"- ReDoc文档: http://localhost:{port}/redoc")
     
@@ -70,7 +75,8 @@ def main():
             "main:app",
             host=host,
             port=port,
-            reload=True,
+            reload=reload,
+            workers=workers,
             log_level="info",
             access_log=True
         )
@@ -0,0 +1,190 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("h5py")
+
+from src.vector_store import VectorStore
+
+
+DIM = 16
+
+
+def _make_store(tmp_path, index_type):
+    store = VectorStore(str(tmp_path / index_type), embedding_dim=DIM, index_type=index_type,
+                        ivf_nlist=2, autosave_interval=0)
+    vectors = np.random.default_rng(0).standard_normal((100, DIM)).astype(np.float32)
+    store.add_vectors(vectors, [{'id': f"v{i}"} for i in range(len(vectors))])
+    if store._reindex_thread is not None:
+        store._reindex_thread.join()
+    return store, vectors
+
+
+def _result_ids(store, query):
+    return [meta['id'] for meta, _ in store.search_similar(query, top_k=5, threshold=-1.0)]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "fp16", "ivf"])
+def test_update_metadata_deleted_flag_syncs_index(tmp_path, index_type):
+    """通过 update_metadata 标记删除/取消删除时，各类索引的搜索结果同步变化"""
+    store, vectors = _make_store(tmp_path, index_type)
+    assert _result_ids(store, vectors[7])[0] == "v7"
+
+    assert store.update_metadata("v7", {'deleted': True})
+    assert "v7" not in _result_ids(store, vectors[7])
+    assert store.get_stats()['deleted_vectors'] == 1
+
+    assert store.update_metadata("v7", {'deleted': False})
+    assert _result_ids(store, vectors[7])[0] == "v7"
+    assert store.get_stats()['deleted_vectors'] == 0
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "sq8"])
+def test_delete_vector_excluded_from_search(tmp_path, index_type):
+    """delete_vector 删除的向量不出现在单条和批量搜索结果中"""
+    store, vectors = _make_store(tmp_path, index_type)
+    assert store.delete_vector("v3")
+
+    assert "v3" not in _result_ids(store, vectors[3])
+    batch_results = store.search_similar_batch(vectors[[3, 4]], top_k=5, threshold=-1.0)
+    assert "v3" not in [meta['id'] for meta, _ in batch_results[0]]
+    assert batch_results[1][0][0]['id'] == "v4"
+
+
+def test_ivf_retrains_in_background_as_store_grows(tmp_path):
+    """向量数足够训练IVF、以及聚类中心数落后于 √N 时，在后台重新训练索引"""
+    import faiss
+
+    store = VectorStore(str(tmp_path / "ivf"), embedding_dim=DIM, index_type="ivf", autosave_interval=0)
+    rng = np.random.default_rng(1)
+
+    def add(count):
+        start = len(store.metadata)
+        vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+        store.add_vectors(vectors, [{'id': f"v{start + i}"} for i in range(count)])
+        if store._reindex_thread is not None:
+            store._reindex_thread.join()
+        return vectors
+
+    add(100)
+    assert isinstance(store._base_index(), faiss.IndexFlatIP)
+
+    vectors = add(900)
+    base = store._base_index()
+    assert isinstance(base, faiss.IndexIVFFlat)
+    first_nlist = base.nlist
+    assert store.faiss_index.ntotal == 1000
+    assert _result_ids(store, vectors[0])[0] == "v100"
+
+    add(3000)
+    assert store._base_index().nlist > first_nlist
+    assert store.faiss_index.ntotal == 4000
+
+
+def test_flat_store_keeps_single_vector_copy(tmp_path):
+    """精确索引由BLAS直接搜索向量矩阵，FAISS索引中不保存第二份向量；保存后重新加载结果一致"""
+    store, vectors = _make_store(tmp_path, "flat")
+    assert store.faiss_index.ntotal == 0
+    store.delete_vector("v5")
+    assert store.save_store()
+
+    reloaded = VectorStore(store.store_dir, embedding_dim=DIM, index_type="flat", autosave_interval=0)
+    assert reloaded.faiss_index.ntotal == 0
+    assert _result_ids(reloaded, vectors[9])[0] == "v9"
+    assert "v5" not in _result_ids(reloaded, vectors[5])
+
+
+def test_bitshuffle_file_without_hdf5plugin_fails_loudly(tmp_path, monkeypatch):
+    """bitshuffle压缩的 vectors.h5 在没有hdf5plugin时报错，而不是以空库启动"""
+    pytest.importorskip("hdf5plugin")
+    from src import vector_store
+
+    store, _ = _make_store(tmp_path, "flat")
+    assert store.save_store()
+
+    monkeypatch.setattr(vector_store, "hdf5plugin", None)
+    with pytest.raises(vector_store.MissingHDF5PluginError):
+        VectorStore(store.store_dir, embedding_dim=DIM, index_type="flat", autosave_interval=0)
+
+
+def test_quantized_store_keeps_float32_vectors_on_disk(tmp_path):
+    """量化索引只在索引内部损失精度，vectors.h5 保存float32原始向量，切换回精确索引后向量不变"""
+    store, vectors = _make_store(tmp_path, "fp16")
+    assert store.save_store()
+
+    reloaded = VectorStore(store.store_dir, embedding_dim=DIM, index_type="flat", autosave_interval=0)
+    np.testing.assert_array_equal(reloaded.vectors, store.vectors)
+
+
+def test_flat_search_ignores_rows_without_metadata(tmp_path):
+    """并发的 add_vectors 已追加向量但尚未追加元数据时，精确搜索不返回这些行"""
+    store, vectors = _make_store(tmp_path, "flat")
+    extra = np.random.default_rng(2).standard_normal((5, DIM)).astype(np.float32)
+    store._append_vectors(store._normalized_copy(extra))
+
+    assert "v0" == _result_ids(store, vectors[0])[0]
+    assert len(_result_ids(store, extra[0])) == 5
+    assert [len(r) for r in store.search_similar_batch(extra, top_k=3, threshold=-1.0)] == [3] * 5
+
+
+def test_emptied_store_removes_stale_vectors_file(tmp_path):
+    """删除全部向量后重建索引并保存，旧的 vectors.h5 不会残留在空元数据旁"""
+    import os
+
+    store, _ = _make_store(tmp_path, "flat")
+    assert store.save_store()
+    for i in range(100):
+        store.delete_vector(f"v{i}")
+    store.rebuild_index()
+    assert store._dirty
+    assert store.flush()
+    assert not os.path.exists(store.vectors_file)
+
+    reloaded = VectorStore(store.store_dir, embedding_dim=DIM, index_type="flat", autosave_interval=0)
+    assert len(reloaded.vectors) == len(reloaded.metadata) == 0
+
+
+def test_row_count_mismatch_resets_store(tmp_path):
+    """vectors.h5 与元数据行数不一致时重置为空库，而不是让行号错位"""
+    store, vectors = _make_store(tmp_path, "flat")
+    assert store.save_store()
+    store.add_vectors(vectors[:3], [{'id': f"extra{i}"} for i in range(3)])
+    store._save_vectors = lambda: None  # 模拟保存元数据后、写入向量前退出
+    assert store.save_store()
+
+    reloaded = VectorStore(store.store_dir, embedding_dim=DIM, index_type="flat", autosave_interval=0)
+    assert len(reloaded.vectors) == len(reloaded.metadata) == 0
+    reloaded.add_vectors(vectors[:2], [{'id': "a"}, {'id': "b"}])
+    assert _result_ids(reloaded, vectors[1])[0] == "b"
+
+
+def test_find_index_with_incremental_adds(tmp_path, monkeypatch):
+    """逐条添加（含重复ID）时，增量合并的ID查找表与最后添加的行一致，删除标记按行对齐"""
+    monkeypatch.setattr(VectorStore, "ID_LOOKUP_TAIL_MIN", 4)
+    store, _ = _make_store(tmp_path, "flat")
+    rng = np.random.default_rng(3)
+    expected = {f"v{i}": i for i in range(100)}
+    for i in range(200):
+        vector_id = f"v{int(rng.integers(0, 300))}"
+        expected[vector_id] = store.add_vectors(rng.standard_normal((1, DIM)), [{'id': vector_id}])[0]
+        if i % 7 == 0:
+            assert all(store._find_index(vector_id) == row for vector_id, row in expected.items())
+
+    assert all(store._find_index(vector_id) == row for vector_id, row in expected.items())
+    assert store._find_index("missing") is None
+    assert len(store.deleted) == len(store.metadata) == 300
+    assert store.delete_vector("v42")
+    assert store.deleted[expected["v42"]] and store.get_stats()['deleted_vectors'] == 1
+
+
+def test_ivf_index_sized_from_training_snapshot(tmp_path):
+    """索引类和聚类中心数按训练向量的行数确定，不受训练期间新增向量的影响"""
+    import faiss
+
+    store, _ = _make_store(tmp_path, "flat")
+    store.index_type, store.ivf_nlist = "ivf", None
+    snapshot = np.random.default_rng(4).standard_normal((1000, DIM)).astype(np.float32)
+    index = store._create_index(snapshot)
+    base = faiss.downcast_index(index.index)
+    assert isinstance(base, faiss.IndexIVFFlat)
+    assert base.nlist == int(np.sqrt(len(snapshot)))